@@ -0,0 +1,625 @@
+"""
+Title: Benchmark Extract Service Info
+
+Description:
+    timings for the text handling, the rest backend
+    and a full extract and compare from
+    Extract Service Info From Portal - MoMo.py
+    run against generated items and a stand in
+    portal so no portal login is needed.
+    The results are saved so runs can be compared.
+
+Date Created: 18/10/2026
+
+"""
+import os
+import importlib.util
+import random
+import timeit
+import time
+import datetime
+import json
+import threading
+import socket
+import shutil
+import tempfile
+import contextlib
+import platform
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def load_extract_module():
+    """
+        import the extract script, the file name has spaces so it cant be imported by name
+    """
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Extract Service Info From Portal - MoMo.py')
+    spec = importlib.util.spec_from_file_location('extract_service_info', script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def make_description(rnd, paragraphs=1):
+    """
+        build a portal style description with the labelled sections and some rogue html
+    """
+    body = ' '.join(['<span style=\'font-size:14px;\'>Array cable route survey &amp; export cable corridor.</span>'] * paragraphs)
+    sections = [
+        '<div><b>Description:</b> {}<br />'.format(body),
+        '<b>Source:</b> <span style=\'font-weight:bold;\'>Survey contractor {}</span><br />'.format(rnd.randint(1, 50)),
+        '<b>Data Class:</b> {}<br />'.format(rnd.randint(1, 4)),
+        '<b>Revision:</b> {:02d}<br />'.format(rnd.randint(1, 20)),
+        '<b>Data Last Edited:</b> 2022-{:02d}-{:02d}<br />'.format(rnd.randint(1, 12), rnd.randint(1, 28)),
+        '<b>Data Number:</b> MOMO-GIS-{:05d}<br />'.format(rnd.randint(1, 99999)),
+        '<b>APRX Location:</b> \\\\share\\MoMo\\Projects\\Cables.aprx<br />',
+        '<b>Layer File Location:</b> \\\\share\\MoMo\\Layers\\Cables.lyrx<br />',
+        '<b>CRS:</b> ETRS89 / UTM zone 30N<br />',
+        '<b>Responsible Work Package:</b> WP{}<br />'.format(rnd.randint(1, 9)),
+        '<b>Contact:</b> <font face=\'Arial, sans-serif\'>A. Person &quot;GIS&quot;</font><br />',
+        '<b>Portal Owner:</b> gis_owner<br />',
+        '<b>Data approved by Work Package Manager:</b> Yes<br />',
+        '<b>Terms of Use:</b> <p>Internal use only</p></div>',
+    ]
+
+    # some users leave out the description label
+    if rnd.random() < 0.2:
+        sections[0] = sections[0].replace('<b>Description:</b>', '')
+
+    return ''.join(sections)
+
+
+def make_descriptions(count, paragraphs=1, seed=1):
+    rnd = random.Random(seed)
+    return [make_description(rnd, paragraphs) for _ in range(count)]
+
+
+def parse_per_field(extract, no_tags_desc):
+    """
+        the previous approach, a full find_el_in_string call for each field
+    """
+    return {attr: extract.find_el_in_string(no_tags_desc, start_el, end_el)
+            for attr, start_el, end_el in extract.DESCRIPTION_FIELDS}
+
+
+def remove_rogue_html_replace_loop(extract, in_str):
+    """
+        the previous approach, two str.replace calls for each rogue element
+    """
+    for el in extract.ROGUE_HTML_RULES:
+        in_str = in_str.replace(el, "")
+        in_str = in_str.replace(el.upper(), "")
+
+    return in_str
+
+
+def handle_markup_replace_loop(data):
+    """
+        the previous handle_break, handle_div and handle_para chain
+    """
+    text = data.strip()
+    text = text.replace('</b>', '\n').replace('<br />', '\n').replace('<b>', '').replace('<br>', '')
+    text = text.strip()
+    text = text.replace('<div>', '').replace('</div>', '')
+    text = text.strip()
+    text = text.replace('<p>', '').replace('</p>', '')
+
+    return text
+
+
+def benchmark_html_scrubber(extract, descriptions, repeat=5):
+    """
+        throughput of the compiled scrubbers against the replace loops
+    """
+    total_mb = sum(len(desc) for desc in descriptions) / 1e6
+
+    timings = {
+        'replace_loop': min(timeit.repeat(
+            lambda: [remove_rogue_html_replace_loop(extract, handle_markup_replace_loop(desc)) for desc in descriptions],
+            number=1, repeat=repeat)),
+        'compiled': min(timeit.repeat(
+            lambda: [extract.remove_rogue_html(extract.handle_markup(desc)) for desc in descriptions],
+            number=1, repeat=repeat)),
+    }
+
+    print('html scrubber, {} descriptions, {:.2f} MB'.format(len(descriptions), total_mb))
+    for name, seconds in timings.items():
+        print('   {:<13}{:.4f}s ({:.1f} MB/s)'.format(name + ':', seconds, total_mb / seconds))
+    print('   speed up:    {:.1f}x'.format(timings['replace_loop'] / timings['compiled']))
+
+    return timings
+
+
+def benchmark_description_parser(extract, descriptions, repeat=5):
+    """
+        time the single pass parser against the per field approach
+    """
+    cleaned = [extract.handle_markup(desc) for desc in descriptions]
+
+    # both approaches must give the same values
+    for no_tags_desc in cleaned:
+        if parse_per_field(extract, no_tags_desc) != extract.parse_description_fields(no_tags_desc):
+            raise ValueError('parsers disagree on description: {}'.format(no_tags_desc))
+
+    per_field = min(timeit.repeat(lambda: [parse_per_field(extract, desc) for desc in cleaned], number=1, repeat=repeat))
+    single_pass = min(timeit.repeat(lambda: [extract.parse_description_fields(desc) for desc in cleaned], number=1, repeat=repeat))
+
+    print('description parser, {} descriptions'.format(len(cleaned)))
+    print('   per field:   {:.4f}s ({:.1f} us per description)'.format(per_field, per_field / len(cleaned) * 1e6))
+    print('   single pass: {:.4f}s ({:.1f} us per description)'.format(single_pass, single_pass / len(cleaned) * 1e6))
+    print('   speed up:    {:.1f}x'.format(per_field / single_pass))
+
+    return {'per_field': per_field, 'single_pass': single_pass}
+
+
+def benchmark_text_functions(extract, descriptions, repeat=5):
+    """
+        time per call of each of the text cleaning functions
+    """
+    cleaned = [extract.handle_markup(desc) for desc in descriptions]
+    functions = {
+        'handle_markup': lambda: [extract.handle_markup(desc) for desc in descriptions],
+        'remove_rogue_html': lambda: [extract.remove_rogue_html(desc) for desc in cleaned],
+        'find_el_in_string': lambda: [extract.find_el_in_string(desc, 'Source:', 'Data Class:') for desc in cleaned],
+        'parse_description_fields': lambda: [extract.parse_description_fields(desc) for desc in cleaned],
+    }
+
+    print('text functions, {} descriptions'.format(len(descriptions)))
+    timings = {}
+    for name, function in functions.items():
+        timings[name] = min(timeit.repeat(function, number=1, repeat=repeat))
+        print('   {:<26}{:.1f} us per call'.format(name + ':', timings[name] / len(descriptions) * 1e6))
+
+    return timings
+
+
+# synthetic portal content, weighted towards the types in the real groups
+FAKE_ITEM_TYPES = [('Feature Service', 30), ('Map Service', 10), ('Shapefile', 8), ('Web Map', 15),
+                   ('Web Mapping Application', 10), ('Dashboard', 5), ('WMS', 4), ('Form', 3),
+                   ('Site Application', 3), ('Code Attachment', 2), ('Vector Tile Service', 2)]
+FAKE_OWNERS = [('owner{:02d}'.format(owner_no), 'Owner {:02d}'.format(owner_no)) for owner_no in range(1, 40)] + [
+               ('CentralAdmin', 'Central Admin')]
+FAKE_CATEGORIES = ['/Categories/Data/Cables', '/Categories/Data/Wind', '/Categories/Data/Bathymetry',
+                   '/Categories/Data/Environmental', '/Categories/Data/Geotechnical']
+
+
+class FakeItem(object):
+    """
+        stand in for an arcgis Item with the attributes the extract reads
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return '<Item title:"{}" type:{} owner:{}>'.format(self.title, self.type, self.owner)
+
+
+class FakeUserManager(object):
+
+    def __init__(self, owners, latency=0.0):
+        self.full_names = dict(owners)
+        self.latency = latency
+
+    def get(self, username):
+        time.sleep(self.latency)
+        return SimpleNamespace(username=username, fullName=self.full_names.get(username))
+
+    def advanced_search(self, query, start=1, max_users=100, as_dict=False):
+        time.sleep(self.latency)
+        usernames = sorted(self.full_names)
+        page = usernames[start - 1:start - 1 + max_users]
+        next_start = start + max_users if start - 1 + max_users < len(usernames) else -1
+        return {'results': [{'username': username, 'fullName': self.full_names[username]} for username in page],
+                'nextStart': next_start}
+
+
+class FakeGroup(object):
+
+    def __init__(self, group_id, title, items, latency=0.0):
+        self.id = group_id
+        self.title = title
+        self.items = items
+        self.latency = latency
+
+    def content(self):
+        time.sleep(self.latency)
+        return list(self.items)
+
+    def __repr__(self):
+        return '<Group title:"{}" owner:owner01>'.format(self.title)
+
+
+class FakeGroupManager(object):
+
+    def __init__(self, groups, latency=0.0):
+        self.groups = groups
+        self.latency = latency
+
+    def search(self, query, max_groups=100):
+        time.sleep(self.latency)
+        if query == '*':
+            return self.groups[:max_groups]
+        title = query.split(':', 1)[-1]
+        return [grp for grp in self.groups if title in grp.title][:max_groups]
+
+
+class FakeContentManager(object):
+    """
+        pages through the items of a group search. The query is not evaluated,
+        every item in the group comes back and the search filter has to keep the
+        right ones, as it does when the portal search is fuzzy
+    """
+
+    def __init__(self, groups, latency=0.0):
+        self.groups = {grp.id: grp for grp in groups}
+        self.latency = latency
+
+    def advanced_search(self, query, max_items=100, start=1, as_dict=False):
+        time.sleep(self.latency)
+        group_id = query.split(' ', 1)[0].split(':', 1)[-1]
+        items = self.groups[group_id].items
+        page = items[start - 1:start - 1 + max_items]
+        next_start = start + max_items if start - 1 + max_items < len(items) else -1
+        return {'results': [dict(item.__dict__) for item in page], 'nextStart': next_start}
+
+
+class FakeGIS(object):
+    """
+        stand in for arcgis.gis.GIS, answers from the synthetic items with
+        an optional latency per portal call
+    """
+
+    def __init__(self, items, owners=FAKE_OWNERS, latency=0.0):
+        groups = [FakeGroup('g1', 'Morgan and Mona', items, latency)]
+        self.users = FakeUserManager(owners, latency)
+        self.groups = FakeGroupManager(groups, latency)
+        self.content = FakeContentManager(groups, latency)
+        self.items_by_id = {item.id: item for item in items}
+
+    def item_from_search(self, item_json):
+        return self.items_by_id[item_json['id']]
+
+
+class FakeFeatureLayerCollection(object):
+    """
+        stand in for FeatureLayerCollection.fromitem, some services have no documentInfo
+    """
+
+    latency = 0.0
+
+    @classmethod
+    def fromitem(cls, item):
+        time.sleep(cls.latency)
+        if item.id.endswith('7'):
+            document_info = {}
+        else:
+            document_info = {'Title': '{}.aprx'.format(item.title.split(' ')[0])}
+        return SimpleNamespace(properties=SimpleNamespace(documentInfo=SimpleNamespace(**document_info)))
+
+
+def make_fake_item(rnd, item_no):
+    item_type = rnd.choices([item_type for item_type, weight in FAKE_ITEM_TYPES],
+                            [weight for item_type, weight in FAKE_ITEM_TYPES])[0]
+    item_id = '{:032x}'.format(item_no)
+    title = 'MoMo_{}_{}'.format(rnd.choice(['Cables', 'Turbines', 'Survey', 'Seabed', 'Birds']), item_no)
+    if item_type == 'Shapefile' and rnd.random() < 0.5:
+        title += ' Downloadable'
+
+    return FakeItem(
+        id=item_id,
+        title=title,
+        type=item_type,
+        owner=rnd.choice(FAKE_OWNERS)[0],
+        tags=rnd.sample(['MoMo', 'Cables', 'Wind', 'Survey', 'Offshore', 'Bathymetry'], rnd.randint(1, 4)),
+        created=1640995200000 + item_no * 60000,
+        modified=1650000000000 + item_no * 60000,
+        snippet='{} summary'.format(title),
+        description=make_description(rnd, rnd.choice([1, 1, 1, 3, 10])) if rnd.random() > 0.05 else None,
+        licenseInfo='<p>Internal use only</p>',
+        spatialReference=rnd.choice(['ETRS_1989_UTM_Zone_30N', 'WGS_1984_Web_Mercator_Auxiliary_Sphere', None]),
+        categories=rnd.sample(FAKE_CATEGORIES, rnd.randint(0, 2)),
+        content_status=rnd.choice(['', '', '', 'authoritative', 'deprecated']),
+        url='https://portal.example/server/rest/services/{}/FeatureServer'.format(item_id),
+    )
+
+
+def make_fake_items(count, seed=1):
+    """
+        synthetic portal items with realistic descriptions, owners, types and categories
+    """
+    rnd = random.Random(seed)
+    return [make_fake_item(rnd, item_no) for item_no in range(count)]
+
+
+def edit_fake_items(items, seed=2, edited=0.05, removed=0.02, added=0.02):
+    """
+        the items a week later, some edited, some removed and some new
+    """
+    rnd = random.Random(seed)
+    week_later = []
+    for item in items:
+        if rnd.random() < removed:
+            continue
+        if rnd.random() < edited:
+            item = FakeItem(**dict(item.__dict__, title=item.title + ' v2', modified=item.modified + 604800000))
+        week_later.append(item)
+    week_later.extend(make_fake_item(rnd, len(items) + item_no) for item_no in range(int(len(items) * added)))
+
+    return week_later
+
+
+def make_item_jsons(count, seed=1):
+    """
+        sharing rest style item json for a stand in portal
+    """
+    rnd = random.Random(seed)
+    item_types = ['Feature Service', 'Map Service', 'Shapefile', 'Web Map', 'Web Mapping Application', 'WMS', 'Dashboard']
+    items = []
+    for item_no in range(count):
+        item_id = '{:032x}'.format(item_no)
+        items.append({
+            'id': item_id,
+            'title': 'MoMo Layer {}'.format(item_no),
+            'type': rnd.choice(item_types),
+            'owner': 'owner{}'.format(rnd.randint(1, 30)),
+            'tags': ['MoMo', 'Cables'],
+            'created': 1640995200000 + item_no * 1000,
+            'modified': 1650000000000 + item_no * 1000,
+            'snippet': 'Layer {} summary'.format(item_no),
+            'description': make_description(rnd),
+            'licenseInfo': '<p>Internal</p>',
+            'spatialReference': 'ETRS_1989_UTM_Zone_30N',
+            'categories': ['/Categories/Data/Cables'],
+            'contentStatus': '',
+            'url': 'http://{{host}}/services/{}/FeatureServer'.format(item_id),
+        })
+
+    return items
+
+
+class StandInPortalHandler(BaseHTTPRequestHandler):
+    """
+        answers the sharing rest requests made by the rest backend from
+        the stand in portal data, with a fixed latency per request
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # headers and body go out in separate writes, dont let nagle hold the body back
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, result):
+        body = json.dumps(result).replace('{host}', self.headers['Host']).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        self.send_json({'token': 'stand-in-token', 'expires': int(time.time() * 1000) + 7200000})
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.server.requests += 1
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path
+
+        if path.endswith('/community/groups'):
+            self.send_json({'results': [{'id': 'g1', 'title': 'Morgan and Mona'}], 'nextStart': -1})
+        elif path.endswith('/search'):
+            start = int(params.get('start', 1))
+            num = int(params.get('num', 100))
+            page = self.server.items[start - 1:start - 1 + num]
+            next_start = start + num if start - 1 + num < len(self.server.items) else -1
+            self.send_json({'results': page, 'nextStart': next_start})
+        elif '/community/users/' in path:
+            username = path.rsplit('/', 1)[-1]
+            self.send_json({'username': username, 'fullName': username.title()})
+        elif path.startswith('/services/'):
+            self.send_json({'documentInfo': {'Title': 'MoMo_Cables.aprx'}})
+        else:
+            self.send_json({'error': {'code': 400, 'message': 'unknown request {}'.format(path)}})
+
+
+class StandInPortalServer(ThreadingHTTPServer):
+    # the rest backend opens many connections at once
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_stand_in_portal(items, latency=0.01):
+    """
+        serve the items from a local stand in portal on a free port, returns the server
+        and the portal url. Call server.shutdown() when finished
+    """
+    server = StandInPortalServer(('127.0.0.1', 0), StandInPortalHandler)
+    server.items = items
+    server.latency = latency
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, 'http://127.0.0.1:{}/portal'.format(server.server_address[1])
+
+
+def benchmark_rest_backend(extract, item_count=500, latency=0.01, concurrency_levels=(1, 4, 16, 32)):
+    """
+        items per second from the rest backend against a stand in portal
+        with a fixed latency per request
+    """
+    server, portal_url = start_stand_in_portal(make_item_jsons(item_count), latency)
+    timings = {}
+    print('rest backend, {} items, {:.0f} ms latency per request'.format(item_count, latency * 1000))
+    try:
+        for concurrency in concurrency_levels:
+            server.requests = 0
+            started = time.perf_counter()
+            records = extract.harvest_rest(portal_url, 'user', 'password', max_concurrency=concurrency)
+            seconds = time.perf_counter() - started
+            timings[concurrency] = seconds
+            print('   concurrency {:>3}: {:.2f}s, {:.0f} items/s, {} requests, {} records'.format(
+                concurrency, seconds, item_count / seconds, server.requests, sum(record is not None for record in records)))
+    finally:
+        server.shutdown()
+
+    return timings
+
+
+def benchmark_end_to_end(extract, item_count, harvest_workers=8, latency=0.0):
+    """
+        a full extract of the synthetic items, a second extract a week later
+        and the comparison of the two, with the phase timings of the extract
+    """
+    items = make_fake_items(item_count)
+    extract.GIS = lambda *args: FakeGIS(items, latency=latency)
+    extract.FeatureLayerCollection = FakeFeatureLayerCollection
+    FakeFeatureLayerCollection.latency = latency
+
+    work_folder = tempfile.mkdtemp(prefix='momo_benchmark_')
+    try:
+        # the extract prints a line per item
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+            df_previous = extract.run_extract_info(os.path.join(work_folder, 'previous.xlsx'), harvest_workers=harvest_workers)
+            extract_seconds = time.perf_counter() - started
+            phases = extract.RUN_TIMINGS.report()['phases']
+            previous_snapshot = extract.save_snapshot(df_previous, work_folder, 'previous')
+
+            items = edit_fake_items(items)
+            df_current = extract.run_extract_info(os.path.join(work_folder, 'current.xlsx'), harvest_workers=harvest_workers)
+            current_snapshot = extract.save_snapshot(df_current, work_folder, 'current')
+
+            started = time.perf_counter()
+            extract.run_comparison_info(current_snapshot, previous_snapshot, 'current', 'previous', work_folder)
+            compare_seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    print('end to end, {} items, {} workers'.format(item_count, harvest_workers))
+    print('   extract: {:.2f}s ({:.0f} items/s)'.format(extract_seconds, item_count / extract_seconds))
+    for phase, totals in sorted(phases.items(), key=lambda phase: -phase[1]['seconds']):
+        print('      {:<22}{:.2f}s'.format(phase + ':', totals['seconds']))
+    print('   compare: {:.2f}s'.format(compare_seconds))
+
+    return {'extract': extract_seconds, 'compare': compare_seconds,
+            'phases': {phase: totals['seconds'] for phase, totals in phases.items()}}
+
+
+def benchmark_group_search(extract, item_count=10000):
+    """
+        the full group content listing against the filtered group search,
+        with how many items each one makes for the harvest
+    """
+    items = make_fake_items(item_count)
+    groups = FakeGIS(items).groups.search('title:Morgan and Mona')
+    timings = {}
+    print('group listing, {} items'.format(item_count))
+    for listing in ('content', 'search'):
+        gis = FakeGIS(items)
+        search_filter = None
+        if listing == 'search':
+            search_filter = extract.ItemSearchFilter(list(extract.REPORT_SHEET_BY_TYPE))
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+            crawled_items = extract.crawl_groups(groups, 1, gis, search_filter)
+            timings[listing] = time.perf_counter() - started
+        print('   {:<8}{:.2f}s, {} items to harvest'.format(listing + ':', timings[listing], len(crawled_items)))
+
+    return timings
+
+
+def flatten_results(results, prefix=''):
+    """
+        the nested results as name: seconds pairs
+    """
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten_results(value, '{}{}.'.format(prefix, name)))
+        else:
+            flat[prefix + str(name)] = value
+
+    return flat
+
+
+def save_results(results, results_folder):
+    """
+        save the results of a run as json, named by the time of the run
+    """
+    os.makedirs(results_folder, exist_ok=True)
+    results_path = os.path.join(results_folder, 'benchmark_{}.json'.format(datetime.datetime.now().strftime('%Y%m%d_%H%M%S')))
+    with open(results_path, 'w', encoding='utf-8') as results_file:
+        json.dump({'saved': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(),
+                   'machine': platform.node(),
+                   'results': results}, results_file, indent=2)
+
+    return results_path
+
+
+def load_previous_results(results_folder, results_path):
+    """
+        the results of the run before this one, the names sort in run order
+    """
+    earlier = sorted(file_name for file_name in os.listdir(results_folder)
+                     if file_name.startswith('benchmark_') and file_name.endswith('.json')
+                     and file_name < os.path.basename(results_path))
+    if not earlier:
+        return None
+
+    with open(os.path.join(results_folder, earlier[-1]), 'r', encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+
+def compare_results(results, previous):
+    """
+        print each timing against the previous run, ratios above 1 are slower
+    """
+    print('against the run saved {} on {}'.format(previous['saved'], previous['machine']))
+    previous_flat = flatten_results(previous['results'])
+    for name, seconds in flatten_results(results).items():
+        if previous_flat.get(name):
+            print('   {:<55}{:>9.4f}s {:>9.4f}s {:>6.2f}x'.format(name, previous_flat[name], seconds, seconds / previous_flat[name]))
+
+
+def main():
+    extract = load_extract_module()
+
+    # sizes of the synthetic portal for the end to end runs
+    scales = (1000, 10000, 100000)
+
+    # results are saved here and compared with the last saved run
+    results_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results')
+
+    results = {
+        'text_functions': benchmark_text_functions(extract, make_descriptions(2000)),
+        'parser': benchmark_description_parser(extract, make_descriptions(2000)),
+        'parser_long': benchmark_description_parser(extract, make_descriptions(200, paragraphs=50)),
+        'scrubber': benchmark_html_scrubber(extract, make_descriptions(2000)),
+        'scrubber_long': benchmark_html_scrubber(extract, make_descriptions(50, paragraphs=2000)),
+        'rest_backend': benchmark_rest_backend(extract),
+        'group_search': benchmark_group_search(extract),
+        'end_to_end': {item_count: benchmark_end_to_end(extract, item_count) for item_count in scales},
+    }
+
+    results_path = save_results(results, results_folder)
+    print('results saved to {}'.format(results_path))
+    previous = load_previous_results(results_folder, results_path)
+    if previous is not None:
+        compare_results(results, previous)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -9,190 +9,228 @@ Description:
     The script also does a comparison with previous
     output versions to determine what has changed.
 
-    
+Usage:
+    python "Extract Service Info From Portal - MoMo.py" extract
+    python "Extract Service Info From Portal - MoMo.py" compare [current] [previous]
+    python "Extract Service Info From Portal - MoMo.py" report [snapshot | --week Week_12]
+    python "Extract Service Info From Portal - MoMo.py" history [current previous]
+    add -h to any of them for the options
     
 Author: Gordon McLachlan
 Date Created: 06/07/2022
  
 """
-import arcpy
-from arcpy import env
 import os
 import datetime
 import time
-
-    
-from arcgis.gis import GIS
-from arcgis.mapping import WebMap
-from arcgis.features import FeatureLayerCollection
-import pandas as pd
-import numpy as np
+import argparse
+import getpass
+import sys
 
 import re
-from re import sub
-import html
 import unicodedata
-import shutil
-
-
-
-def df_excel_sheet(in_excel, in_sheet):
+import json
+import sqlite3
+import csv
+import threading
+import random
+import bisect
+import contextlib
+import gzip
+import hashlib
+import types
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# the arcgis api takes seconds to import, it is only loaded by the commands that go to the
+# portal. pandas, numpy, xlsxwriter and asyncio are imported in the functions that use them
+GIS = None
+FeatureLayerCollection = None
+
+
+def load_arcgis():
+    global GIS, FeatureLayerCollection
+    if GIS is None:
+        from arcgis.gis import GIS
+    if FeatureLayerCollection is None:
+        from arcgis.features import FeatureLayerCollection
+
+
+
+# columns used to match and describe services between two reports, every
+# other column in the content hash is compared (COMPARE_VALUE_COLUMNS)
+COMPARE_KEY_COLUMNS = ['Service ID']
+COMPARE_EXTRA_COLUMNS = ['URL']
+
+
+def diff_reports(df_current, df_previous, key_columns=COMPARE_KEY_COLUMNS,
+                 value_columns=None, extra_columns=COMPARE_EXTRA_COLUMNS):
     """
-        read in excel sheet and convert to dataframe
+        null aware comparison of two reports on any key and value columns.
+        Returns the updated, new and removed rows with the current (or previous
+        for removed) values, updated rows also get a Changed Fields column
+        listing which of the value columns differ. Rows with the same content
+        hash on both sides are unchanged and are not compared field by field,
+        so the value columns need to be ones the hash covers
     """
-    
-    # open excel in data frame
-    xl = pd.ExcelFile(in_excel)
-    df = xl.parse(in_sheet)
-
-    return df
-
-def compare_excel(curr_xl, prev_xl, sheet_name, writer):
-
-    # convert to dataframe
-    df_data_report_current = df_excel_sheet(curr_xl, sheet_name)
-    df_data_report_previous = df_excel_sheet(prev_xl, sheet_name)
-
-    # get the key columns
-    df_data_report_current_keycol = df_data_report_current[['Service ID','Title', 'Date Data Was Lasted Edited', 'Data Number', 'URL']]
-    df_data_report_previous_keycol = df_data_report_previous[['Service ID','Title', 'Date Data Was Lasted Edited', 'Data Number', 'URL']]
-
-    # outer merge
-    df_merged = df_data_report_current_keycol.merge(df_data_report_previous_keycol, how='outer', left_on='Service ID', right_on='Service ID')
-
-    # rename
-    df_merged = df_merged.rename(columns={"Title_x": "Title_Cur", 
-                                          "Date Data Was Lasted Edited_x": "Date Data Was Lasted Edited_Cur", 
-                                          "Data Number_x": "Data Number_Cur", 
-                                          "URL_x": "URL_Cur", 
-                                          "Title_y": "Title_Pre", 
-                                          "Date Data Was Lasted Edited_y": 
-                                          "Date Data Was Lasted Edited_Pre",
-                                          "Data Number_y": "Data Number_Pre", 
-                                          "URL_y": "URL_Pre"})
-    
+    import numpy as np
+    import pandas as pd
+
+    if value_columns is None:
+        value_columns = COMPARE_VALUE_COLUMNS
+    out_columns = list(key_columns) + list(value_columns) + list(extra_columns)
+
+    # drop the services whose content is unchanged before the field by field comparison
+    df_hashes = df_current[key_columns].assign(**{CONTENT_HASH_COLUMN: content_hashes(df_current)}).merge(
+        df_previous[key_columns].assign(**{CONTENT_HASH_COLUMN: content_hashes(df_previous)}),
+        on=list(key_columns) + [CONTENT_HASH_COLUMN])
+    unchanged = pd.MultiIndex.from_frame(df_hashes[key_columns])
+    df_current = df_current[~pd.MultiIndex.from_frame(df_current[key_columns]).isin(unchanged)]
+    df_previous = df_previous[~pd.MultiIndex.from_frame(df_previous[key_columns]).isin(unchanged)]
+
+    # empty cells read back from excel as null, treat empty strings the same way
+    df_cur = df_current[out_columns].replace('', np.nan)
+    df_pre = df_previous[out_columns].replace('', np.nan)
+
+    df_merged = df_cur.merge(df_pre, how='outer', on=key_columns, suffixes=('_Cur', '_Pre'), indicator=True)
+
+    cur_columns = list(key_columns) + [column + '_Cur' for column in out_columns[len(key_columns):]]
+    pre_columns = list(key_columns) + [column + '_Pre' for column in out_columns[len(key_columns):]]
+
+    # new and removed services are only on one side of the merge
+    df_new = df_merged.loc[df_merged['_merge'] == 'left_only', cur_columns]
+    df_new.columns = out_columns
+    df_removed = df_merged.loc[df_merged['_merge'] == 'right_only', pre_columns]
+    df_removed.columns = out_columns
+
+    # compare all the value columns at once, two values are the same if both are null or both are equal
+    df_both = df_merged[df_merged['_merge'] == 'both']
+    cur_values = df_both[[column + '_Cur' for column in value_columns]].to_numpy(dtype=object)
+    pre_values = df_both[[column + '_Pre' for column in value_columns]].to_numpy(dtype=object)
+    cur_null = pd.isna(cur_values)
+    pre_null = pd.isna(pre_values)
+    changed = (cur_null != pre_null) | (~cur_null & ~pre_null & (cur_values != pre_values))
+    row_changed = changed.any(axis=1)
+
+    df_dif = df_both.loc[row_changed, cur_columns]
+    df_dif.columns = out_columns
+    value_names = np.array(value_columns, dtype=object)
+    df_dif['Changed Fields'] = [', '.join(value_names[row]) for row in changed[row_changed]]
+
+    return df_dif, df_new, df_removed
+
+
+def compare_reports(df_data_report_current, df_data_report_previous, sheet_name, writer):
+    """
+        compare one sheet of the current and previous reports and write
+        the updated, new and removed services to the comparison workbook
+    """
+    df_dif, df_new, df_removed = diff_reports(df_data_report_current, df_data_report_previous)
 
-    # get all the removed services
-    df_removed = df_merged[df_merged['Title_Cur'].isna()]
-    df_removed = df_removed[['Service ID','Title_Pre', 'Date Data Was Lasted Edited_Pre', 'Data Number_Pre', 'URL_Pre']]
-    df_removed = df_removed.rename(columns={"Title_Pre": "Title", "Date Data Was Lasted Edited_Pre": "Date Data Was Lasted Edited", "Data Number_Pre": "Data Number", "URL_Pre": "URL"})
-    # print(df_removed)
+    # export to excel
+    df_dif.to_excel(writer,sheet_name = 'Updated {}'.format(sheet_name), index=False, header=True)
+    df_new.to_excel(writer,sheet_name = 'New {}'.format(sheet_name), index=False, header=True)
+    df_removed.to_excel(writer,sheet_name = 'Removed {}'.format(sheet_name), index=False, header=True)
 
 
-    # get all new services
-    df_new = df_merged[df_merged['Title_Pre'].isna()]
-    df_new = df_new[['Service ID','Title_Cur', 'Date Data Was Lasted Edited_Cur', 'URL_Cur']]
-    df_new = df_new.rename(columns={"Title_Cur": "Title", "Date Data Was Lasted Edited_Cur": "Date Data Was Lasted Edited", "Data Number_Cur": "Data Number", "URL_Cur": "URL"})
-    # print(df_new)
-    
 
-    # differences
-    # filter out the "new"
-    df_dif = df_merged[df_merged['Title_Cur'].str.len() > 0]
-    # filter out the "removed"
-    df_dif = df_dif[df_merged['Title_Pre'].str.len() > 0]
-    
-    
-    ## CHECK DIFFERENCES
-    # I tried to do this in singel query but the null values were confusing the queries. So split up to make sure it is picking up correct data
-    # CHECK THE DATA NUMBER DIFFERENCES
-    # check if curr is null but previously it wasnt
-    comparison_column = np.where(
-                                (df_dif['Data Number_Cur'].isna()) & (df_dif['Data Number_Pre'].notna()), 
-                                False, True) 
-    df_dif["equal"] = comparison_column
-
-    # check if  curr not null but previously it was
-    comparison_column = np.where(
-                                (df_dif['Data Number_Cur'].notna()) & (df_dif['Data Number_Pre'].isna()), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-    # check if values are differeny
-    comparison_column = np.where(
-                                ((df_dif['Data Number_Cur'].notna()) & (df_dif['Data Number_Pre'].notna())) & (df_dif["Data Number_Cur"]!=df_dif["Data Number_Pre"]), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-
-    # CHECK THE TITLE DIFFERENCES
-    comparison_column = np.where(
-                                (df_dif['Title_Cur'].isna()) & (df_dif['Title_Pre'].notna()), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-    # check if  curr not null but previously it was
-    comparison_column = np.where(
-                                (df_dif['Title_Cur'].notna()) & (df_dif['Title_Pre'].isna()), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-    # check if values are differeny
-    comparison_column = np.where(
-                                ((df_dif['Title_Cur'].notna()) & (df_dif['Title_Pre'].notna())) & (df_dif["Title_Cur"]!=df_dif["Title_Pre"]), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-
-    # CHECK THE DATE DIFFERENCES
-    comparison_column = np.where(
-                                (df_dif['Date Data Was Lasted Edited_Cur'].isna()) & (df_dif['Date Data Was Lasted Edited_Pre'].notna()), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-    # check if  curr not null but previously it was
-    comparison_column = np.where(
-                                (df_dif['Date Data Was Lasted Edited_Cur'].notna()) & (df_dif['Date Data Was Lasted Edited_Pre'].isna()), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-    # check if values are differeny
-    comparison_column = np.where(
-                                ((df_dif['Date Data Was Lasted Edited_Cur'].notna()) & (df_dif['Date Data Was Lasted Edited_Pre'].notna())) & (df_dif["Date Data Was Lasted Edited_Cur"]!=df_dif["Date Data Was Lasted Edited_Pre"]), 
-                                False, df_dif["equal"]) 
-    df_dif["equal"] = comparison_column
-
-
-
-    # clean up findings
-    df_dif = df_dif[df_dif['equal'] == False]
-    df_dif = df_dif.iloc[:, lambda df: [0, 1, 2, 3, 4]]
-    df_dif = df_dif.rename(columns={"Title_Cur": "Title", "Date Data Was Lasted Edited_Cur": "Date Data Was Lasted Edited", "Data Number_Cur": "Data Number", "URL_Cur": "URL"})
+class HtmlScrubber(object):
+    """
+        replaces every literal in a rule table in a single case-insensitive regex pass.
+        The literals are compiled into a prefix tree pattern so each position in the
+        text is only tried against the literals that start with that character,
+        the longest literal wins where several start at the same place
+    """
 
+    def __init__(self, rules):
+        self.replacements = {}
+        for literal, replacement in rules:
+            self.replacements[literal.lower()] = replacement
 
-    # export to excel
+        self.compiled = None
 
-    df_dif.to_excel(writer,sheet_name = 'Updated {}'.format(sheet_name), index=False, header=True)
-    df_new.to_excel(writer,sheet_name = 'New {}'.format(sheet_name), index=False, header=True)
-    df_removed.to_excel(writer,sheet_name = 'Removed {}'.format(sheet_name), index=False, header=True)
+        # plain string replacement is quicker when everything is just removed
+        if set(self.replacements.values()) == {''}:
+            self.replace = ''
+        else:
+            self.replace = self.replace_match
+
+    @property
+    def pattern(self):
+        # compiled on first use, compiling the big rule tables slows the start of every command
+        if self.compiled is None:
+            self.compiled = re.compile(self.tree_pattern(self.replacements), re.IGNORECASE | re.ASCII)
+        return self.compiled
+
+    @staticmethod
+    def tree_pattern(literals):
+        """
+            build a regex of nested groups from a prefix tree of the literals
+        """
+        tree = {}
+        for literal in literals:
+            node = tree
+            for char in literal:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def node_pattern(node):
+            branches = []
+            for char in sorted(key for key in node if key != ''):
+                branches.append(re.escape(char) + node_pattern(node[char]))
+
+            if not branches:
+                return ''
+
+            pattern = '(?:{})'.format('|'.join(branches))
+            # a literal ends here, carry on greedily in case a longer one matches
+            if '' in node:
+                pattern += '?'
+
+            return pattern
+
+        return node_pattern(tree)
+
+    def replace_match(self, match):
+        return self.replacements[match.group(0).lower()]
+
+    def scrub(self, text):
+        return self.pattern.sub(self.replace, text)
+
+
+# markup turned into line breaks or removed before the description is stored
+MARKUP_RULES = [
+    ('</b>', '\n'),
+    ('<br />', '\n'),
+    ('<b>', ''),
+    ('<br>', ''),
+    ('<div>', ''),
+    ('</div>', ''),
+    ('<p>', ''),
+    ('</p>', ''),
+]
+
+MARKUP_SCRUBBER = HtmlScrubber(MARKUP_RULES)
+
+
+def handle_markup(data):
+    """
+        turn bold and break tags into new lines and drop div and paragraph tags
+    """
+    if data is None:
+        return None
+
+    text = data.strip()
+    if len(text) == 0:
+        return None
 
+    text = MARKUP_SCRUBBER.scrub(text).strip()
+    if len(text) == 0:
+        return None
 
+    return text
 
-def handle_break(data):
-    if data is not None:
-        text = data.strip()
-        if len(text) > 0:
-            text = sub('</b>', '\n', text)
-            text = sub('<br />', '\n', text)
-            text = text.replace('<b>', '')
-            text = text.replace('<br>', '')
-            return text
-
-def handle_div(data):
-    if data is not None:
-        text = data.strip()
-        if len(text) > 0:
-            text = text.replace('<div>', '')
-            text = text.replace('</div>', '')
-            return text
-
-def handle_para(data):
-    if data is not None:
-        text = data.strip()
-        if len(text) > 0:
-            text = text.replace('<p>', '')
-            text = text.replace('</p>', '')
-            return text
 
 def find_list_index(check_el, in_list):
 
@@ -212,6 +250,119 @@ def delete_carriage_returns_string(in_str):
     
     return str_new
 
+
+# known rogue html elements left in descriptions by formatting, add new ones here
+ROGUE_HTML_RULES = [
+    "<span style='font-weight:bold;'>",
+    '<SPAN STYLE="font-weight:bold;">',
+    "<span style='font-family:inherit;'>",
+    "<span style='font-family:inherit; font-weight:bold;'>",
+    "<span style='font-size:16px;'>",
+    "<span style='font-family:inherit; font-size:16px;'>",
+    "<span style='font-size:14.6667px;'>",
+    "<span style='font-size:14px;'>",
+    "<span style='background-color:rgb(232, 235, 250); color:rgb(36, 36, 36);'>",
+    "<span style='font-size:11.0pt; font-family:&quot;Calibri&quot;,sans-serif;'>",
+    "<span style='font-size:11.0pt; font-family:Calibri,sans-serif;'>",
+    "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'> <span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<span style='font-size:11pt; font-family:Calibri, sans-serif;'>",
+    "<span style='font-family:Calibri, sans-serif; font-size:14.6667px;'>",
+    "<span style='font-family:Calibri, sans-serif; font-size:11pt;'>",
+    "<font face='inherit'>",
+    "<font size='3'>",
+    "<font face='Arial, sans-serif'>",
+    "<font color='#242424' face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
+    "<font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'><span style='font-size:14px;'>",
+    "<font style='font-family:inherit; font-size:16px;'>",
+    "<font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
+    "<font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
+    "<span style='font-size:14px;'>",
+    "<span style='font-family:inherit; font-weight:bold; font-size:16px;'>",
+    "<span style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
+    "<span style='color:rgb(36, 36, 36); font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px; background-color:rgb(232, 235, 250);'>",
+    "<span style='background-color:rgb(232, 235, 250); color:rgb(36, 36, 36); font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px;'>",
+    "<span style='font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; color:rgb(36, 36, 36); font-size:14px; background-color:rgb(232, 235, 250);'>",
+    "<span style='color:rgba(0, 0, 0, 0.9); font-family:&quot;Segoe UI VSS (Regular)&quot;, &quot;Segoe UI&quot;, -apple-system, BlinkMacSystemFont, Roboto, &quot;Helvetica Neue&quot;, Helvetica, Ubuntu, Arial, sans-serif, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Symbol&quot;; font-size:14px;'>",
+    "<span style='color:rgb(36, 36, 36); font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px;'>",
+    "<span style='font-family:-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif; font-size:14px;'>",
+    "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'> <span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<span style='font-size:medium; font-family:inherit;'>",
+    "<span style='font-size:11.0pt; font-family:Calibri,sans-serif;'>",
+    "<span style='font-family:Calibri, sans-serif; font-size:14.6667px;'>",
+    "<span style='font-size:11pt; font-family:Calibri, sans-serif;'>",
+    "<span style='font-family:Calibri, sans-serif; font-size:14.6667px;'>",
+    "<p style='margin-top:0px; margin-bottom:1.5rem;'>",
+    "<p style='margin-top:0px; margin-bottom:1.5rem; font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
+    "<p style='margin-top:0px; margin-bottom:1.5rem; font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
+    "<p style='margin:0 0 0 0;'>",
+    "<p style='font-family:inherit; font-size:16px; margin-top:0px; margin-bottom:1.5rem;'>",
+    "<p style='margin-top:0px; margin-bottom:0px;'>",
+    "<p style='margin-top:0px; margin-bottom:0px;'><font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'><span style='font-size:14px;'>",
+    "<p style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<p style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<font face='Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif'>",
+    "<font face='Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif'><span style='font-size:16px;'>",
+    "<font style='font-family:inherit;'>",
+    "<font face='Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif' style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
+    "<font color='rgba(0, 0, 0, 0.9)' face='Segoe UI VSS (Regular), Segoe UI, -apple-system, BlinkMacSystemFont, Roboto, Helvetica Neue, Helvetica, Ubuntu, Arial, sans-serif, Apple Color Emoji, Segoe UI Emoji, Segoe UI Symbol'><span style='font-size:14px;'>",
+    "<font color='#242424' face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
+    "<font style='font-family:inherit; font-size:16px;'>",
+    "<div style='max-width:100%; display:inherit;'>",
+    "<div style='font-family:inherit;'>",
+    "<div style='margin-bottom:3rem;'>",
+    "<div style='text-align:Left;'>",
+    "<div style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
+    "<div style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px; max-width:100%; display:inherit;'>",
+    "<div style='box-sizing:border-box; font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px;'>",
+    "<div style='font-family:inherit; font-size:16px;'>",
+    "<div style='font-size:16px; font-family:inherit;'>",
+    "<div style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
+    "<div style='font-family:Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif;'><div style='font-size:16px; font-family:inherit;'>",
+    "<div style='font-size:16px; font-family:inherit;'>",
+    "<div style='font-family:Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif;'>",
+    "<div style='font-size:16px; font-family:inherit;'>",
+    "</li><li><span style='font-size:medium; font-family:Segoe UI, Arial, sans-serif;'>",
+    "</li><li><span style='font-family:Segoe UI, Arial, sans-serif;'>",
+    "</span>",
+    "<span>",
+    "<span />",
+    "<span >",
+    "<font>",
+    "</font>",
+    "amp;",
+    "<a href=",
+    "rel='nofollow ugc' style='font-family:inherit;' target='_blank'>",
+    "rel='nofollow ugc' style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;' target='_blank'>",
+    "rel='nofollow ugc' target='_blank'>",
+    "<a>",
+    "</a>",
+    "<p>",
+    "</p>",
+    "<ul>",
+    "</ul>",
+    "</ul>",
+    "</li>",
+    "&lt;/h4&gt;",
+    "<a target='_blank'>",
+    "&quot;",
+    "&lt;o:p&gt;&lt;/o:p&gt;",
+    "&lt;",
+    "&gt;",
+]
+
+# the entities are taken out in a second pass after the elements, as the old replace
+# loop did with them at the end of the list, so an entity split by an element that
+# is taken out (&q<span>uot;) is joined up first and then removed
+ROGUE_HTML_SCRUBBER = HtmlScrubber([(el, '') for el in ROGUE_HTML_RULES if not el.startswith('&')])
+ROGUE_ENTITY_SCRUBBER = HtmlScrubber([(el, '') for el in ROGUE_HTML_RULES if el.startswith('&')])
+
+# entities escaped any number of times (&amp;amp;quot;) are collapsed to the plain entity
+# before the rules are matched, as the old replace loop did by taking out amp; first
+ESCAPED_AMP_RE = re.compile(r'&(?:amp;)+', re.IGNORECASE)
+
+
 def remove_rogue_html(in_str):
     """
         remove known rogue html elements from input string, caused by formatting
@@ -220,111 +371,11 @@ def remove_rogue_html(in_str):
     if in_str is None:
         return None
 
-    remove_el_list = [
-                        "<span style='font-weight:bold;'>",
-                        '<SPAN STYLE="font-weight:bold;">',
-                        "<span style='font-family:inherit;'>",
-                        "<span style='font-family:inherit; font-weight:bold;'>",
-                        "<span style='font-size:16px;'>",
-                        "<span style='font-family:inherit; font-size:16px;'>",
-                        "<span style='font-size:14.6667px;'>",
-                        "<span style='font-size:14px;'>",
-                        "<span style='background-color:rgb(232, 235, 250); color:rgb(36, 36, 36);'>"
-                        "<span style='font-size:11.0pt; font-family:&quot;Calibri&quot;,sans-serif;'>"
-                        "<span style='font-size:11.0pt; font-family:Calibri,sans-serif;'>",
-                        "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'> <span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<span style='font-size:11pt; font-family:Calibri, sans-serif;'>",
-                        "<span style='font-family:Calibri, sans-serif; font-size:14.6667px;'>",
-                        "<span style='font-family:Calibri, sans-serif; font-size:11pt;'>"
-                        "<font face='inherit'>",
-                        "<font size='3'>",
-                        "<font face='Arial, sans-serif'>",
-                        "<font color='#242424' face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
-                        "<font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'><span style='font-size:14px;'>",
-                        "<font style='font-family:inherit; font-size:16px;'>",
-                        "<font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
-                        "<font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
-                        "<span style='font-size:14px;'>",
-                        "<span style='font-family:inherit; font-weight:bold; font-size:16px;'>",
-                        "<span style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
-                        "<span style='color:rgb(36, 36, 36); font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px; background-color:rgb(232, 235, 250);'>",
-                        "<span style='background-color:rgb(232, 235, 250); color:rgb(36, 36, 36); font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px;'>",
-                        "<span style='font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; color:rgb(36, 36, 36); font-size:14px; background-color:rgb(232, 235, 250);'>",
-                        "<span style='color:rgba(0, 0, 0, 0.9); font-family:&quot;Segoe UI VSS (Regular)&quot;, &quot;Segoe UI&quot;, -apple-system, BlinkMacSystemFont, Roboto, &quot;Helvetica Neue&quot;, Helvetica, Ubuntu, Arial, sans-serif, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Symbol&quot;; font-size:14px;'>",
-                        "<span style='color:rgb(36, 36, 36); font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px;'>",
-                        "<span style='font-family:-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif; font-size:14px;'>",
-                        "<span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'> <span style='font-weight:bold; font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<span style='font-size:medium; font-family:inherit;'>", 
-                        "<span style='font-size:11.0pt; font-family:Calibri,sans-serif;'>",
-                        "<span style='font-family:Calibri, sans-serif; font-size:14.6667px;'>",
-                        "<span style='font-size:11pt; font-family:Calibri, sans-serif;'>",
-                        "<span style='font-family:Calibri, sans-serif; font-size:14.6667px;'>",
-                        "<p style='margin-top:0px; margin-bottom:1.5rem;'>",
-                        "<p style='margin-top:0px; margin-bottom:1.5rem; font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
-                        "<p style='margin-top:0px; margin-bottom:1.5rem; font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
-                        "<p style='margin:0 0 0 0;'>",
-                        "<p style='font-family:inherit; font-size:16px; margin-top:0px; margin-bottom:1.5rem;'>",
-                        "<p style='margin-top:0px; margin-bottom:0px;'>",
-                        "<p style='margin-top:0px; margin-bottom:0px;'><font face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'><span style='font-size:14px;'>",
-                        "<p style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<p style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<font face='Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif'>",
-                        "<font face='Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif'><span style='font-size:16px;'>",
-                        "<font style='font-family:inherit;'>",
-                        "<font face='Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif' style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
-                        "<font color='rgba(0, 0, 0, 0.9)' face='Segoe UI VSS (Regular), Segoe UI, -apple-system, BlinkMacSystemFont, Roboto, Helvetica Neue, Helvetica, Ubuntu, Arial, sans-serif, Apple Color Emoji, Segoe UI Emoji, Segoe UI Symbol'><span style='font-size:14px;'>",
-                        "<font color='#242424' face='-apple-system, BlinkMacSystemFont, Segoe UI, system-ui, Apple Color Emoji, Segoe UI Emoji, Segoe UI Web, sans-serif'>",
-                        "<font style='font-family:inherit; font-size:16px;'>",
-                        "<div style='max-width:100%; display:inherit;'>",
-                        "<div style='font-family:inherit;'>",
-                        "<div style='margin-bottom:3rem;'>",
-                        "<div style='text-align:Left;'>",
-                        "<div style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px;'>",
-                        "<div style='font-family:&quot;Avenir Next W01&quot;, &quot;Avenir Next W00&quot;, &quot;Avenir Next&quot;, Avenir, &quot;Helvetica Neue&quot;, sans-serif; font-size:16px; max-width:100%; display:inherit;'>",
-                        "<div style='box-sizing:border-box; font-family:-apple-system, BlinkMacSystemFont, &quot;Segoe UI&quot;, system-ui, &quot;Apple Color Emoji&quot;, &quot;Segoe UI Emoji&quot;, &quot;Segoe UI Web&quot;, sans-serif; font-size:14px;'>",
-                        "<div style='font-family:inherit; font-size:16px;'>",
-                        "<div style='font-size:16px; font-family:inherit;'>",
-                        "<div style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;'>",
-                        "<div style='font-family:Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif;'><div style='font-size:16px; font-family:inherit;'>",
-                        "<div style='font-size:16px; font-family:inherit;'>",
-                        "<div style='font-family:Avenir Next W01, Avenir Next W00, Avenir Next, Avenir, Helvetica Neue, sans-serif;'>",
-                        "<div style='font-size:16px; font-family:inherit;'>",
-                        "</li><li><span style='font-size:medium; font-family:Segoe UI, Arial, sans-serif;'>",
-                        "</li><li><span style='font-family:Segoe UI, Arial, sans-serif;'>",
-                        "</span>",
-                        "<span>",
-                        "<span />",
-                        "<span >",
-                        "<font>",
-                        "</font>",
-                        "amp;",
-                        "<a href=",
-                        "rel='nofollow ugc' style='font-family:inherit;' target='_blank'>",
-                        "rel='nofollow ugc' style='font-family:Avenir Next, Avenir, Helvetica Neue, Helvetica, Arial, sans-serif; font-size:15px;' target='_blank'>",
-                        "rel='nofollow ugc' target='_blank'>",
-                        "<a>",
-                        "</a>",
-                        "<p>",
-                        "</p>",
-                        "<ul>",
-                        "</ul>",
-                        "</ul>",
-                        "</li>",
-                        "&lt;/h4&gt;",
-                        "<a target='_blank'>",
-                        "&quot;",
-                        "&lt;o:p&gt;&lt;/o:p&gt;",
-                        "&lt;",
-                        "&gt;"
-    ]
-
-    for el in remove_el_list:
-        in_str = in_str.replace(el, "")
-        in_str = in_str.replace(el.upper(), "")
-    
-    return in_str
+    text = ROGUE_HTML_SCRUBBER.scrub(ESCAPED_AMP_RE.sub('&', in_str))
+    if '&' not in text:
+        return text
+
+    return ROGUE_ENTITY_SCRUBBER.scrub(text)
 
 
 # add start and end to string
@@ -365,6 +416,14 @@ def find_el_in_string(in_string, start_el, end_el=None):
         else:
             return None
 
+    return clean_description_field(substring_select)
+
+
+def clean_description_field(substring_select):
+    """
+        tidy up a value taken from the description
+    """
+
     # clean up big space at start
     substring_select_clean = substring_select.replace('                            ', '')
 
@@ -380,13 +439,1203 @@ def find_el_in_string(in_string, start_el, end_el=None):
     return substring_select_clean
 
 
+# record attribute, start label and end label of the values held in the description
+DESCRIPTION_FIELDS = [
+    ('layer_file_location', 'Layer File Location:', 'CRS:'),
+    ('aprx_location', 'APRX Location:', 'Layer File Location:'),
+    ('source', 'Source:', 'Data Class:'),
+    ('data_last_edited', 'Data Last Edited:', 'Data Number:'),
+    ('description', 'Description:', 'Source:'),
+    ('data_number', 'Data Number:', 'APRX Location:'),
+    ('contact', 'Contact:', 'Portal Owner:'),
+    ('responsible_wp', 'Responsible Work Package:', 'Contact:'),
+    ('data_class', 'Data Class:', 'Revision:'),
+    ('approved_by', 'Data approved by Work Package Manager:', 'Terms of Use:'),
+    ('terms_of_use', 'Terms of Use:', None),
+    ('revision', 'Revision:', 'Data Last Edited:'),
+    ('crs_self_reported', 'CRS:', 'Responsible Work Package:'),
+]
+
+# every label in one pattern, none of the labels is contained in another so a
+# single scan finds the same occurrences as splitting on each label in turn
+DESCRIPTION_LABEL_RE = re.compile('|'.join(
+    re.escape(label) for label in sorted(
+        set(el for field in DESCRIPTION_FIELDS for el in field[1:] if el is not None), key=len, reverse=True)))
+
+
+def parse_description_fields(in_string):
+    """
+        pull every labelled value out of a description in one go.
+        The description is cleaned once and all the labels are found in a single
+        scan, the values are the same as calling find_el_in_string for each field
+    """
+
+    # clean in string
+    in_string = remove_rogue_html(in_string)
+
+    if in_string is None:
+        return dict.fromkeys([field[0] for field in DESCRIPTION_FIELDS])
+
+    # start and end position of each occurrence of each label
+    label_spans = {}
+    for match in DESCRIPTION_LABEL_RE.finditer(in_string):
+        label_spans.setdefault(match.group(0), []).append(match.span())
+
+    fields = {}
+    for attr, start_el, end_el in DESCRIPTION_FIELDS:
+        start_spans = label_spans.get(start_el, [])
+        end_spans = label_spans.get(end_el, [])
+
+        if start_spans:
+            # the value runs from the end of the first start label up to the next
+            # start label, or the first end label in between if there is one
+            select_start = start_spans[0][1]
+            select_end = start_spans[1][0] if len(start_spans) > 1 else len(in_string)
+            if end_el is not None:
+                for end_start, end_end in end_spans:
+                    if end_start >= select_start and end_end <= select_end:
+                        select_end = end_start
+                        break
+            fields[attr] = clean_description_field(in_string[select_start:select_end])
+
+        elif end_el is None:
+            fields[attr] = clean_description_field('')
+
+        elif start_el == 'Description:':
+            # sometimes no description tag is put in at the start, so just split by end
+            select_end = end_spans[0][0] if end_spans else len(in_string)
+            fields[attr] = clean_description_field(in_string[:select_end])
+
+        else:
+            fields[attr] = None
+
+    return fields
+
+
+
+# record attribute and report column, in report column order
+REPORT_FIELDS = [
+    ('service_id', 'Service ID'),
+    ('title', 'Title'),
+    ('type', 'Type'),
+    ('group', 'Group'),
+    ('downloadable', 'Downloadable'),
+    ('created', 'Date Created'),
+    ('modified', 'Date Last Modified'),
+    ('data_last_edited', 'Date Data Was Lasted Edited'),
+    ('revision', 'Revision'),
+    ('data_number', 'Data Number'),
+    ('data_class', 'Class (1-4)'),
+    ('source', 'Source'),
+    ('contact', 'Contact(s)'),
+    ('responsible_wp', 'Responsible WP'),
+    ('owner', 'Portal Owner'),
+    ('approved_by', 'Data approved by WPM'),
+    ('summary', 'Summary'),
+    ('description', 'Description'),
+    ('aprx_uploaded_from', 'APRX Uploaded From'),
+    ('aprx_location', 'APRX Location'),
+    ('layer_file_location', 'Layer File Location'),
+    ('crs_service', 'CRS Service'),
+    ('crs_self_reported', 'CRS Self Reported'),
+    ('terms_of_use', 'Terms of Use'),
+    ('tags', 'Tags'),
+    ('categories', 'Categories'),
+    ('status', 'Status'),
+    ('url', 'URL'),
+    ('raw_description', 'Raw Description'),
+]
+
+REPORT_COLUMNS = [column for attr, column in REPORT_FIELDS]
+REPORT_ATTRS = {column: attr for attr, column in REPORT_FIELDS}
+
+# how the report dataframe holds the columns. Columns with a few values repeated down
+# the report are categoricals, text that repeats between items is interned so each
+# distinct value is held once and the dates are datetimes
+REPORT_CATEGORY_COLUMNS = ['Type', 'Group', 'Downloadable', 'Class (1-4)', 'Responsible WP', 'Portal Owner',
+                           'Categories', 'Status']
+REPORT_INTERNED_COLUMNS = ['Date Data Was Lasted Edited', 'Revision', 'Source', 'Contact(s)', 'Data approved by WPM',
+                           'APRX Uploaded From', 'APRX Location', 'Layer File Location', 'CRS Service',
+                           'CRS Self Reported', 'Terms of Use', 'Tags']
+REPORT_DATE_COLUMNS = ['Date Created', 'Date Last Modified']
+REPORT_DATE_FORMAT = '%Y-%m-%d'
+
+# every record carries a hash of its content so unchanged services can be skipped
+# when two reports are compared. The raw description is left out as it is not
+# always kept, the parsed description and fields cover it
+CONTENT_HASH_COLUMN = 'Content Hash'
+FINGERPRINT_COLUMNS = [column for column in REPORT_COLUMNS if column != 'Raw Description']
+FINGERPRINT_ATTRS = [REPORT_ATTRS[column] for column in FINGERPRINT_COLUMNS]
+COMPARE_VALUE_COLUMNS = [column for column in FINGERPRINT_COLUMNS
+                         if column not in COMPARE_KEY_COLUMNS + COMPARE_EXTRA_COLUMNS]
+
+
+def content_fingerprint(values):
+    """
+        blake2b hash of field values in FINGERPRINT_COLUMNS order, as text with
+        null, nan and empty strings all hashing the same
+    """
+    text = '\x1f'.join('' if value is None or value != value else str(value) for value in values)
+
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ServiceRecord(object):
+    """
+        one row of the metadata report, one attribute per report column.
+        Values are strings (None where the description has no such label),
+        fields that are not given default to an empty string
+    """
+
+    __slots__ = tuple(attr for attr, column in REPORT_FIELDS)
+
+    def __init__(self, **fields):
+        for attr in self.__slots__:
+            setattr(self, attr, fields.pop(attr, ''))
+        if fields:
+            raise TypeError('unknown service record fields: {}'.format(', '.join(fields)))
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(**dict(zip(cls.__slots__, values)))
+
+    def values(self):
+        return [getattr(self, attr) for attr in self.__slots__]
+
+    def as_dict(self):
+        return {column: getattr(self, attr) for attr, column in REPORT_FIELDS}
+
+    def fingerprint(self):
+        return content_fingerprint(getattr(self, attr) for attr in FINGERPRINT_ATTRS)
+
+
+class RecordAccumulator(object):
+    """
+        collects service records into one list per column so the report
+        dataframe is built once at the end rather than appended row by row.
+        The category columns are dictionary encoded as they come in, the
+        raw descriptions are only kept when asked for. The content hash of
+        each record goes in a last column
+    """
+
+    def __init__(self, raw_descriptions=False):
+        self.fields = [(attr, column) for attr, column in REPORT_FIELDS
+                       if raw_descriptions or column != 'Raw Description']
+        self.columns = {}
+        self.categories = {}
+        for attr, column in self.fields:
+            if column in REPORT_CATEGORY_COLUMNS:
+                self.columns[attr] = array('i')
+                self.categories[attr] = {}
+            else:
+                self.columns[attr] = []
+        self.interned = [REPORT_ATTRS[column] for column in REPORT_INTERNED_COLUMNS]
+        self.fingerprints = []
+        self.row_count = 0
+
+    def append(self, record):
+        for attr, values in self.columns.items():
+            value = getattr(record, attr)
+            if attr in self.categories:
+                # null is code -1, otherwise the index of the value in the categories
+                codes = self.categories[attr]
+                value = -1 if value is None else codes.setdefault(value, len(codes))
+            elif attr in self.interned and type(value) is str:
+                value = sys.intern(value)
+            values.append(value)
+        self.fingerprints.append(record.fingerprint())
+        self.row_count += 1
+
+    def __len__(self):
+        return self.row_count
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        data = {}
+        for attr, column in self.fields:
+            values = self.columns[attr]
+            if attr in self.categories:
+                data[column] = pd.Categorical.from_codes(values, categories=list(self.categories[attr]))
+            elif column in REPORT_DATE_COLUMNS:
+                data[column] = pd.to_datetime(values, format=REPORT_DATE_FORMAT, errors='coerce')
+            else:
+                data[column] = values
+        data[CONTENT_HASH_COLUMN] = self.fingerprints
+
+        return pd.DataFrame(data, columns=[column for attr, column in self.fields] + [CONTENT_HASH_COLUMN])
+
+
+def report_text_frame(df_report):
+    """
+        the report dataframe with the values as they are written out, the dates
+        as report text, categoricals as plain values and nulls as None
+    """
+    import pandas as pd
+
+    df_report = df_report.copy()
+    for column in REPORT_DATE_COLUMNS:
+        if column in df_report.columns and pd.api.types.is_datetime64_any_dtype(df_report[column]):
+            df_report[column] = df_report[column].dt.strftime(REPORT_DATE_FORMAT)
+
+    return df_report.astype(object).where(df_report.notna(), None)
+
+
+def content_hashes(df_report):
+    """
+        the content hash of each row, from the hash column or worked out for
+        reports from before there was one. Missing columns hash as empty
+    """
+    import pandas as pd
+
+    if CONTENT_HASH_COLUMN in df_report.columns:
+        return df_report[CONTENT_HASH_COLUMN]
+
+    df_text = report_text_frame(df_report.reindex(columns=FINGERPRINT_COLUMNS))
+
+    return pd.Series([content_fingerprint(values) for values in df_text.itertuples(index=False, name=None)],
+                     index=df_report.index, dtype=object)
+
+
+def records_from_frame(df_report):
+    """
+        service records from a report dataframe or snapshot, with the dates back as
+        report text. Columns left out of the frame, like the raw descriptions, are empty
+    """
+    columns = [column for column in REPORT_COLUMNS if column in df_report.columns]
+    df_report = report_text_frame(df_report[columns])
+
+    attrs = [REPORT_ATTRS[column] for column in columns]
+    for values in df_report.itertuples(index=False, name=None):
+        yield ServiceRecord(**dict(zip(attrs, values)))
+
+
+# portal errors worth another go, throttling errors also slow the calls down
+THROTTLE_ERROR_RE = re.compile(r'\b(429|503)\b|too many requests|service unavailable|rate limit', re.IGNORECASE)
+TRANSIENT_ERROR_RE = re.compile(r'\b(500|502|504)\b|timed? ?out|connection (aborted|reset|refused|error)|'
+                                r'cannot connect|disconnected|temporarily', re.IGNORECASE)
+
+
+def is_throttle_error(error):
+    return THROTTLE_ERROR_RE.search(str(error)) is not None
+
+
+def is_transient_error(error):
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    return is_throttle_error(error) or TRANSIENT_ERROR_RE.search(str(error)) is not None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """
+        full jitter exponential backoff, a random wait of up to base x 2^attempt seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def latency_percentiles(latencies):
+    """
+        call count and latency percentiles in seconds
+    """
+    ordered = sorted(latencies)
+
+    def percentile(pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    return {'calls': len(ordered), 'p50': percentile(50), 'p90': percentile(90),
+            'p99': percentile(99), 'max': ordered[-1]}
+
+
+class AdaptiveLimiter(object):
+    """
+        additive increase, multiplicative decrease limit on the portal calls in flight.
+        The limit halves on a throttling error or a latency spike against the usual
+        latency of the endpoint, and grows back by about one call for each round of
+        calls that go through cleanly. Calls quicker than spike_floor seconds are
+        never a spike, jitter on fast or cached calls would otherwise back off a
+        healthy portal
+    """
+
+    def __init__(self, max_limit=8, min_limit=1, spike_factor=3.0, warm_up_calls=10, spike_floor=0.25):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.spike_factor = spike_factor
+        self.spike_floor = spike_floor
+        self.warm_up_calls = warm_up_calls
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.baselines = {}
+        self.last_decrease = 0.0
+        self.decreases = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, endpoint, seconds, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            calls, baseline = self.baselines.get(endpoint, (0, seconds))
+            spike = calls >= self.warm_up_calls and seconds > max(baseline * self.spike_factor, self.spike_floor)
+
+            if throttled or spike:
+                # the calls in flight saw the same problem, only back off once for them
+                now = time.monotonic()
+                if now - self.last_decrease > baseline:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_decrease = now
+                    self.decreases += 1
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            # moving average of the latency, throttled calls dont count
+            if not throttled:
+                self.baselines[endpoint] = (calls + 1, baseline * 0.9 + seconds * 0.1)
+
+            self.condition.notify_all()
+
+
+class PortalCalls(object):
+    """
+        the layer the arcgis portal calls go through. Calls are held back by an
+        adaptive limiter, transient failures are retried with jittered exponential
+        backoff and the latency of each endpoint is recorded for the run report
+    """
+
+    def __init__(self, max_concurrency=8, retries=4, backoff_base=0.5, backoff_cap=30.0):
+        self.configure(max_concurrency, retries, backoff_base, backoff_cap)
+
+    def configure(self, max_concurrency=8, retries=4, backoff_base=0.5, backoff_cap=30.0):
+        """
+            start afresh for a run
+        """
+        self.limiter = AdaptiveLimiter(max(1, max_concurrency))
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.latencies = {}
+        self.retried = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+
+    def retry_delay(self, endpoint, error, attempt):
+        """
+            the wait before the next attempt at a failed call, or None to give up
+        """
+        if attempt >= self.retries or not is_transient_error(error):
+            with self.lock:
+                self.failed += 1
+            return None
+
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        with self.lock:
+            self.retried += 1
+        print('{} failed ({}), retrying in {:.1f}s'.format(endpoint, error, delay))
+
+        return delay
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """
+            func(*args, **kwargs) as a portal call to the endpoint.
+            Dont make portal calls from inside func, with a limit of one they would wait forever
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                seconds = time.perf_counter() - started
+                self.limiter.release(endpoint, seconds, throttled=is_throttle_error(error))
+                self.record(endpoint, seconds)
+                delay = self.retry_delay(endpoint, error, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            seconds = time.perf_counter() - started
+            self.limiter.release(endpoint, seconds)
+            self.record(endpoint, seconds)
+            return result
+
+    def percentiles(self):
+        with self.lock:
+            return {endpoint: latency_percentiles(latencies) for endpoint, latencies in self.latencies.items()}
+
+    def report(self):
+        print('portal calls: {} retried, {} failed, concurrency limit {:.1f}, backed off {} times'.format(
+            self.retried, self.failed, self.limiter.limit, self.limiter.decreases))
+        for endpoint, stats in sorted(self.percentiles().items()):
+            print('   {}: {} calls, p50 {:.3f}s, p90 {:.3f}s, p99 {:.3f}s, max {:.3f}s'.format(
+                endpoint, stats['calls'], stats['p50'], stats['p90'], stats['p99'], stats['max']))
+
+
+# all the portal calls in a run share the limiter and the latency figures
+PORTAL_CALLS = PortalCalls()
+
+
+# upper bounds in seconds of the item latency histogram buckets
+ITEM_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
-def get_basic_info(portal, grp_feat, gis):
 
-    # HTML cleaning - not great but does the job
-    tag_re = re.compile(r'(<!--.*?-->|<[^>]*>)')
+def latency_histogram(latencies, buckets=ITEM_LATENCY_BUCKETS):
+    """
+        number of latencies up to each bucket bound, with the rest over the last bound
+    """
+    counts = [0] * (len(buckets) + 1)
+    for seconds in latencies:
+        counts[bisect.bisect_left(buckets, seconds)] += 1
+
+    labels = ['<= {}s'.format(bound) for bound in buckets] + ['> {}s'.format(buckets[-1])]
+    return dict(zip(labels, counts))
+
+
+class RunTimings(object):
+    """
+        the time spent in each phase of a run and the time taken by each item,
+        written out as a json run report. Phases that run on the worker threads
+        add up across the threads so they can come to more than the run took
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.phases = {}
+        self.items = []
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self.lock:
+            totals = self.phases.setdefault(phase, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - started)
+
+    def merge(self, phases):
+        # phases timed in a worker process
+        with self.lock:
+            for phase, (calls, seconds) in phases.items():
+                totals = self.phases.setdefault(phase, [0, 0.0])
+                totals[0] += calls
+                totals[1] += seconds
+
+    def item(self, grp_feat, seconds, source):
+        with self.lock:
+            self.items.append((str(grp_feat.id), grp_feat.title, grp_feat.type, source, seconds))
+
+    def count(self, name, value):
+        with self.lock:
+            self.counts[name] = value
+
+    def report(self, slowest=20):
+        with self.lock:
+            items = list(self.items)
+            phases = {phase: {'calls': calls, 'seconds': seconds} for phase, (calls, seconds) in self.phases.items()}
+            counts = dict(self.counts)
+
+        latencies = [item[4] for item in items]
+        latencies_by_type = {}
+        for item in items:
+            latencies_by_type.setdefault(item[2], []).append(item[4])
+
+        return {
+            'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'seconds': time.time() - self.started,
+            'phases': phases,
+            'items': {
+                'latency': latency_percentiles(latencies) if latencies else None,
+                'histogram': latency_histogram(latencies),
+                'histogram_by_type': {item_type: latency_histogram(type_latencies)
+                                      for item_type, type_latencies in sorted(latencies_by_type.items())},
+                'slowest': [dict(zip(('id', 'title', 'type', 'source', 'seconds'), item))
+                            for item in sorted(items, key=lambda item: item[4], reverse=True)[:slowest]],
+            },
+            'portal_calls': PORTAL_CALLS.percentiles(),
+            'counts': counts,
+        }
+
+    def save(self, report_path):
+        with open(report_path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+        return report_path
+
+
+# the timings of the run, reset at the start of each run
+RUN_TIMINGS = RunTimings()
+
+
+def configure_connection_pool(gis, pool_size):
+    """
+        let the arcgis session keep a connection open for each worker, requests
+        only keeps 10 by default. _con is private to the arcgis api so the pool
+        is left alone if it is not there
+    """
+    try:
+        session = gis._con._session
+        # newer versions of the api wrap the requests session
+        session = getattr(session, 'session', session)
+        for adapter in session.adapters.values():
+            adapter.init_poolmanager(pool_size, pool_size)
+    except AttributeError as error:
+        print('connection pool left at the default size: {}'.format(error))
+
+
+class RecordStore(object):
+    """
+        the last extracted record for each service id, kept in a local sqlite
+        file along with the item modified time and owner it was extracted from.
+        Items that have not changed since the last run reuse their stored record
+    """
+
+    def __init__(self, store_path, force_refresh=False):
+        self.connection = sqlite3.connect(store_path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS records '
+                                '(service_id TEXT PRIMARY KEY, modified INTEGER, owner TEXT, record TEXT)')
+        self.force_refresh = force_refresh
+        self.stored = {}
+        for service_id, modified, owner, record in self.connection.execute('SELECT * FROM records'):
+            self.stored[service_id] = (modified, owner, record)
+        self.updates = {}
+        self.reused = 0
+        self.resumed = 0
+        self.extracted = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, grp_feat):
+        """
+            returns (True, record) if the item is unchanged since it was stored,
+            the record is None for items that were left out of the report
+        """
+        stored = self.stored.get(str(grp_feat.id))
+        if self.force_refresh or stored is None or stored[0] != grp_feat.modified or stored[1] != grp_feat.owner:
+            return False, None
+
+        with self.lock:
+            self.reused += 1
+            self.updates[str(grp_feat.id)] = stored
+        if stored[2] is None:
+            return True, None
+
+        return True, ServiceRecord.from_values(json.loads(stored[2]))
+
+    def store(self, grp_feat, record):
+        with self.lock:
+            self.extracted += 1
+            self.update(grp_feat, record)
+
+    def keep(self, grp_feat, record):
+        """
+            keep a record resumed from the run journal, it was extracted before the restart
+        """
+        with self.lock:
+            self.resumed += 1
+            self.update(grp_feat, record)
+
+    def update(self, grp_feat, record):
+        # a record made without its service properties is extracted again next run
+        if record is not None and isinstance(record.aprx_uploaded_from, DoclocUnavailable):
+            self.updates.pop(str(grp_feat.id), None)
+            return
+
+        record_json = None
+        if record is not None:
+            record_json = json.dumps(record.values())
+        self.updates[str(grp_feat.id)] = (grp_feat.modified, grp_feat.owner, record_json)
+
+    def save(self):
+        """
+            replace the store with the items seen in this run, so deleted items drop out
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM records')
+            self.connection.executemany('INSERT INTO records VALUES (?, ?, ?, ?)',
+                                        [(service_id,) + stored for service_id, stored in self.updates.items()])
+
+    def close(self):
+        self.connection.close()
+
+    def report(self):
+        print('record store: {} items reused, {} items resumed, {} items extracted'.format(
+            self.reused, self.resumed, self.extracted))
+
+
+class RunJournal(object):
+    """
+        journal of the records completed in a run, so a run that fails part way
+        through can pick up where it stopped. Each record is written with its
+        position in the item listing and checkpointed to disk every
+        checkpoint_every items. The journal is removed once the run finishes
+    """
+
+    def __init__(self, journal_path, checkpoint_every=100, max_age_hours=24):
+        self.journal_path = journal_path
+        self.checkpoint_every = checkpoint_every
+        self.completed = {}
+        self.last_position = -1
+        self.resumed = 0
+        self.pending = 0
+
+        started = self.load(max_age_hours)
+
+        # rewrite the journal with the entries that were read, a run that was
+        # killed mid write can leave half a line at the end
+        self.journal_file = open(journal_path, 'w', encoding='utf-8')
+        self.journal_file.write(json.dumps({'started': started or time.time()}) + '\n')
+        for entry in self.completed.values():
+            self.journal_file.write(json.dumps(entry) + '\n')
+        self.checkpoint()
+
+    def load(self, max_age_hours):
+        """
+            read the journal left by a failed run, returns the time the run started
+        """
+        if not os.path.isfile(self.journal_path):
+            return None
+
+        with open(self.journal_path, 'r', encoding='utf-8') as journal_file:
+            try:
+                header = json.loads(journal_file.readline())
+            except ValueError:
+                return None
+
+            age_hours = (time.time() - header['started']) / 3600
+            if age_hours > max_age_hours:
+                print('run journal is {:.1f} hours old, starting again'.format(age_hours))
+                return None
+
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self.completed[entry['id']] = entry
+                self.last_position = max(self.last_position, entry['position'])
+
+        print('resuming run: {} items already done, up to item {} in the listing'.format(
+            len(self.completed), self.last_position + 1))
+
+        return header['started']
+
+    def lookup(self, grp_feat):
+        """
+            returns (True, record) for an item completed before the restart that
+            has not changed since, the record is None for items left out of the report
+        """
+        entry = self.completed.get(str(grp_feat.id))
+        if entry is None or entry['modified'] != grp_feat.modified or entry['owner'] != grp_feat.owner:
+            return False, None
+
+        self.resumed += 1
+        if entry['record'] is None:
+            return True, None
+
+        record = ServiceRecord.from_values(entry['record'])
+        # json drops the marker, put it back so the record store still leaves the record out
+        if entry.get('docloc_unavailable'):
+            record.aprx_uploaded_from = DOCLOC_UNAVAILABLE
+
+        return True, record
+
+    def append(self, position, grp_feat, record):
+        entry = {'position': position, 'id': str(grp_feat.id), 'modified': grp_feat.modified,
+                 'owner': grp_feat.owner, 'record': None if record is None else record.values()}
+        if record is not None and isinstance(record.aprx_uploaded_from, DoclocUnavailable):
+            entry['docloc_unavailable'] = True
+        self.completed[entry['id']] = entry
+        self.journal_file.write(json.dumps(entry) + '\n')
+
+        self.pending += 1
+        if self.pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if not self.journal_file.closed:
+            self.checkpoint()
+            self.journal_file.close()
+
+    def remove(self):
+        """
+            the run finished, the next run starts afresh
+        """
+        self.journal_file.close()
+        os.remove(self.journal_path)
+
+    def report(self):
+        print('run journal: {} items resumed'.format(self.resumed))
+
+
+class OwnerDirectory(object):
+    """
+        lookup of portal usernames to full names.
+        Lookups are memoised for the run, the directory can also be preloaded
+        from the portal in pages and kept in a json cache on disk between runs.
+        The cache lasts two weeks from the last bulk load so it sees the weekly
+        run through, users looked up since then are added to it as they are found
+    """
+
+    def __init__(self, gis, cache_path=None, cache_ttl_hours=336):
+        self.gis = gis
+        self.cache_path = cache_path
+        self.cache_ttl_hours = cache_ttl_hours
+        self.cache_loaded = None
+        self.full_names = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def load_cache(self):
+        """
+            load the on disk cache if it exists and the bulk load it came
+            from is younger than the ttl
+        """
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return False
+
+        with open(self.cache_path, 'r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+
+        # caches from before the bulk load time was kept separately only have the saved time
+        loaded = cache.get('loaded', cache['saved'])
+        age_hours = (time.time() - loaded) / 3600
+        if age_hours > self.cache_ttl_hours:
+            print('owner cache was loaded from the portal {:.1f} hours ago, ignoring it'.format(age_hours))
+            return False
+
+        self.full_names.update(cache['users'])
+        self.cache_loaded = loaded
+        return True
+
+    def save_cache(self):
+        """
+            write the directory to disk with the time it was saved and the time
+            of the last bulk load, the cache expires from the bulk load
+        """
+        if self.cache_path is None:
+            return
+
+        with self.lock:
+            saved = time.time()
+            cache = {'loaded': self.cache_loaded or saved, 'saved': saved, 'users': dict(self.full_names)}
+        with open(self.cache_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(cache, cache_file)
+
+    def preload(self, page_size=100):
+        """
+            fill the directory with all portal users, from the disk cache if
+            it is still valid, otherwise in paged queries to the portal
+        """
+        if self.load_cache():
+            print('owner directory loaded from cache: {} users'.format(len(self.full_names)))
+            return
+
+        start = 1
+        while start > 0:
+            page = PORTAL_CALLS.call('users.advanced_search', self.gis.users.advanced_search,
+                                     query='*', start=start, max_users=page_size, as_dict=True)
+            for user in page['results']:
+                self.full_names[user['username']] = user.get('fullName')
+            start = page.get('nextStart', -1)
+
+        self.cache_loaded = time.time()
+        print('owner directory preloaded from portal: {} users'.format(len(self.full_names)))
+
+    def full_name(self, username):
+        """
+            get the full name of a portal user, only going to the portal the first time
+        """
+        with self.lock:
+            if username in self.full_names:
+                self.hits += 1
+                return self.full_names[username]
+            self.misses += 1
+
+        full_name = PORTAL_CALLS.call('users.get', self.gis.users.get, username=username).fullName
+        with self.lock:
+            self.full_names[username] = full_name
+
+        return full_name
+
+    def report(self):
+        print('owner directory: {} hits, {} misses, {} users'.format(self.hits, self.misses, len(self.full_names)))
+
+
+class ItemHandler(object):
+    """
+        how the items of a type are extracted: the record fields they get, whether
+        the owner and title exclusions apply to them and whether the service
+        properties are fetched for them, the only lookup that not every type needs
+    """
+
+    __slots__ = ('name', 'fields', 'apply_exclusions', 'service_properties')
+
+    def __init__(self, name, fields, apply_exclusions, service_properties):
+        self.name = name
+        self.fields = fields
+        self.apply_exclusions = apply_exclusions
+        self.service_properties = service_properties
+
+
+# maps, apps and tools only get the basic information
+BASIC_FIELDS = ('service_id', 'title', 'type', 'group', 'created', 'modified', 'owner', 'summary',
+                'description', 'terms_of_use', 'tags', 'categories', 'status', 'url', 'raw_description')
+# services get everything, downloadable data everything but the service properties
+SERVICE_FIELDS = tuple(attr for attr, column in REPORT_FIELDS)
+DOWNLOADABLE_FIELDS = tuple(attr for attr in SERVICE_FIELDS if attr != 'aprx_uploaded_from')
+
+ITEM_HANDLERS = {
+    'basic': ItemHandler('basic', BASIC_FIELDS, apply_exclusions=False, service_properties=False),
+    'downloadable': ItemHandler('downloadable', DOWNLOADABLE_FIELDS, apply_exclusions=True, service_properties=False),
+    'service': ItemHandler('service', SERVICE_FIELDS, apply_exclusions=True, service_properties=True),
+}
+
+# portal item type: (handler, report sheet). Items with no sheet are extracted
+# but left out of the report files, types not listed are handled as services
+ITEM_TYPES = {
+    'Map Service': ('service', 'Services'),
+    'Feature Service': ('service', 'Services'),
+    'WMS': ('basic', 'Services'),
+    'WMTS': ('basic', 'Services'),
+    'Shapefile': ('downloadable', 'Downloadable'),
+    'Web Map': ('basic', 'Maps'),
+    'Site Application': ('basic', 'Apps and Tools'),
+    'Web Mapping Application': ('basic', 'Apps and Tools'),
+    'Code Attachment': ('basic', 'Apps and Tools'),
+    'Geoprocessing Service': ('basic', 'Apps and Tools'),
+    'Dashboard': ('basic', 'Apps and Tools'),
+    'Form': ('basic', 'Apps and Tools'),
+    'Data Store': ('basic', 'Apps and Tools'),
+    'Table Layer': ('basic', None),
+    'AppBuilder Extension': ('basic', None),
+    'Scene Package': ('basic', None),
+    'Image Service': ('basic', None),
+    'Scene Service': ('basic', None),
+    'Image': ('basic', None),
+    'Feature Collection': ('basic', None),
+    'Web Scene': ('basic', None),
+    'File Geodatabase': ('basic', None),
+    'Vector Tile Package': ('basic', None),
+    'StoryMap': ('basic', None),
+    'Network Analysis Service': ('basic', None),
+}
+DEFAULT_ITEM_TYPE = ('service', None)
+
+MAP_APP_TYPES = tuple(item_type for item_type, (handler, sheet_name) in ITEM_TYPES.items() if handler == 'basic')
+
+# item types that go in each sheet of the report, and the sheet of each type
+REPORT_SHEETS = {}
+for item_type, (handler, sheet_name) in ITEM_TYPES.items():
+    if sheet_name is not None:
+        REPORT_SHEETS.setdefault(sheet_name, []).append(item_type)
+REPORT_SHEET_BY_TYPE = {item_type: sheet_name for item_type, (handler, sheet_name) in ITEM_TYPES.items() if sheet_name is not None}
+
+
+def item_handler(service_type):
+    return ITEM_HANDLERS[ITEM_TYPES.get(service_type, DEFAULT_ITEM_TYPE)[0]]
+
+# central is onwer as this token doesnt have permision to access details
+EXCLUDED_OWNERS = ('CentralAdmin', 'CentralAdmin - Central Admin', 'esri_livingatlas', 'esri_livingatlas - Esri')
+
+# this is a permisions error I cannot get around
+EXCLUDED_TITLES = ('Ops_Dash_Master_Layers_Forecast', 
+                   'Ops_Dash_Master_Layers_Temperature', 
+                   'Ops_Dash_Master_Layers_Wave',
+                   'Ops_Dash_Master_Layers_Wind')
+EXCLUDED_TITLES_OWNER = 'wamvg6'
+
+
+def is_excluded(service_title, service_owner):
+    """
+        services left out of the report
+    """
+    if service_owner in EXCLUDED_OWNERS:
+        return True
+
+    return service_title in EXCLUDED_TITLES and service_owner == EXCLUDED_TITLES_OWNER
+
+
+def needs_service_properties(service_type, service_title, service_owner):
+    """
+        only services in the report need the service properties for the aprx they came from
+    """
+    handler = item_handler(service_type)
+    if not handler.service_properties:
+        return False
+
+    return not (handler.apply_exclusions and is_excluded(service_title, service_owner))
+
+
+# the excluded owners as portal usernames, for the search query
+EXCLUDED_OWNER_USERNAMES = tuple(sorted(set(owner.split(' - ')[0] for owner in EXCLUDED_OWNERS)))
+
+
+class ItemSearchFilter(object):
+    """
+        item types, owners and a modified date pushed into the portal search of
+        a group, so items left out of the report are never listed. The search
+        is fuzzy on types, so the results are checked again with keep before
+        any item is made from them. The owner exclusion only applies to the
+        types with exclusions, like is_excluded
+    """
+
+    def __init__(self, item_types=None, excluded_owners=EXCLUDED_OWNER_USERNAMES, modified_since=None, page_size=100):
+        self.item_types = None if item_types is None else set(item_types)
+        self.excluded_owners = set(excluded_owners)
+        self.modified_since = modified_since
+        self.page_size = page_size
+        self.listed = 0
+        self.kept = 0
+        self.lock = threading.Lock()
+
+    def query(self, group_id):
+        query = 'group:{}'.format(group_id)
+        if self.item_types is not None:
+            query += ' AND ({})'.format(' OR '.join('type:"{}"'.format(item_type) for item_type in sorted(self.item_types)))
+
+        if self.excluded_owners:
+            # the group term gives the negated owners something to match against
+            owners_query = 'group:{} {}'.format(group_id, ' '.join('NOT owner:{}'.format(owner)
+                                                                   for owner in sorted(self.excluded_owners)))
+            unexcluded_types = [item_type for item_type in MAP_APP_TYPES
+                                if self.item_types is None or item_type in self.item_types]
+            if unexcluded_types:
+                owners_query = '{} OR ({})'.format(' OR '.join('type:"{}"'.format(item_type) for item_type in unexcluded_types),
+                                                   owners_query)
+            query += ' AND ({})'.format(owners_query)
+
+        if self.modified_since is not None:
+            query += ' AND modified:[{:019d} TO 9999999999999999999]'.format(self.modified_since)
+
+        return query
+
+    def keep(self, item_json):
+        item_type = item_json.get('type')
+        kept = not ((self.item_types is not None and item_type not in self.item_types) or
+                    (item_json.get('owner') in self.excluded_owners and item_handler(item_type).apply_exclusions) or
+                    (self.modified_since is not None and (item_json.get('modified') or 0) < self.modified_since))
+        with self.lock:
+            self.listed += 1
+            self.kept += kept
+
+        return kept
+
+    def report(self):
+        print('group search: {} items listed, {} kept'.format(self.listed, self.kept))
+
+
+def read_service_properties(grp_feat):
+    # the properties are loaded lazily, read them inside the portal call
+    load_arcgis()
+    return FeatureLayerCollection.fromitem(grp_feat).properties
+
+
+class DoclocUnavailable(str):
+    """
+        the 'None' reported when the service properties could not be fetched, told
+        apart from a service with no documentInfo so it is never cached or stored
+    """
+
+
+DOCLOC_UNAVAILABLE = DoclocUnavailable('None')
+
+
+def fetch_service_docloc(grp_feat):
+    """
+        title of the aprx the service was published from, from the service properties
+    """
+    try:
+        service_properties = PORTAL_CALLS.call('service properties', read_service_properties, grp_feat)
+    except Exception as error:
+        print('no service properties for {}: {}'.format(grp_feat.title, error))
+        return DOCLOC_UNAVAILABLE
+    # print(service_properties)
+
+    # to get description from the actual metadata from the uploaded data rather than service
+    # service_summary = grp_feat_flc.properties.serviceDescription
+    # service_description = grp_feat_flc.properties.description
+    
+    # services published without a document have no documentInfo
+    try:
+        service_docloc = service_properties.documentInfo.Title
+    except (AttributeError, KeyError):
+        service_docloc = 'None'
+
+    # try:
+    #     service_cats = service_properties.documentInfo.Category
+    # except:
+    #     service_cats = 'None'
+
+    return service_docloc
+
+
+class ServicePropertiesCache(object):
+    """
+        the service properties used in the report, kept in a json cache on disk
+        between runs. Entries are keyed by the service url and the item modified
+        date, so an edited item is fetched again. Only called for the items that
+        need the service properties, misses are fetched as they come up. Failed
+        fetches are not cached, the item is fetched again next run
+    """
+
+    def __init__(self, cache_path=None, fetch=None):
+        self.cache_path = cache_path
+        self.fetch = fetch or fetch_service_docloc
+        self.doclocs = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.fetch_seconds = 0.0
+        self.mean_fetch_seconds = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(grp_feat):
+        return '{}|{}'.format(grp_feat.url, grp_feat.modified)
+
+    def load_cache(self):
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return False
+
+        with open(self.cache_path, 'r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+
+        self.doclocs.update(cache['doclocs'])
+        self.mean_fetch_seconds = cache.get('mean_fetch_seconds')
+        return True
+
+    def save_cache(self):
+        """
+            write the entries used in this run to disk, so removed and edited items drop out
+        """
+        if self.cache_path is None:
+            return
+
+        with self.lock:
+            cache = {'saved': time.time(), 'mean_fetch_seconds': self.mean_fetch(), 'doclocs': dict(self.used)}
+        with open(self.cache_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(cache, cache_file)
+
+    def lookup(self, grp_feat):
+        """
+            returns (True, docloc) for a cached item, (False, None) if it needs fetching
+        """
+        key = self.key(grp_feat)
+        with self.lock:
+            if key not in self.doclocs:
+                return False, None
+            self.hits += 1
+            self.used[key] = self.doclocs[key]
+            return True, self.doclocs[key]
+
+    def store(self, grp_feat, docloc, fetch_seconds):
+        key = self.key(grp_feat)
+        with self.lock:
+            self.misses += 1
+            self.fetch_seconds += fetch_seconds
+            if isinstance(docloc, DoclocUnavailable):
+                self.failures += 1
+                return
+            self.doclocs[key] = docloc
+            self.used[key] = docloc
+
+    def docloc(self, grp_feat):
+        """
+            title of the aprx the service was published from, only going to the
+            service the first time. Can be passed to build_service_record as fetch_docloc
+        """
+        found, docloc = self.lookup(grp_feat)
+        if found:
+            return docloc
+
+        started = time.perf_counter()
+        docloc = self.fetch(grp_feat)
+        self.store(grp_feat, docloc, time.perf_counter() - started)
+
+        return docloc
+
+    def mean_fetch(self):
+        # the latency of this run, or of the last run with misses when everything was cached
+        if self.misses:
+            return self.fetch_seconds / self.misses
+        return self.mean_fetch_seconds
+
+    def report(self):
+        mean_fetch = self.mean_fetch()
+        if mean_fetch is None:
+            time_saved = 'unknown'
+        else:
+            time_saved = '{:.1f}s'.format(self.hits * mean_fetch)
+        print('service properties: {} hits, {} misses, {} failed, {:.1f}s fetching, about {} saved'.format(
+            self.hits, self.misses, self.failures, self.fetch_seconds, time_saved))
+
+
+def lookup_service_owner(grp_feat, gis, owner_directory=None):
+    """
+        the owner of an item as username - full name
+    """
+
+    # get portal user name
+    started = time.perf_counter()
+    portal_owner_id = grp_feat.owner
+    if owner_directory is not None:
+        portal_owner_full_name = owner_directory.full_name(portal_owner_id)
+    else:
+        portal_owner_user = PORTAL_CALLS.call('users.get', gis.users.get, username=portal_owner_id)
+        portal_owner_full_name = portal_owner_user.fullName
+    service_owner = '{} - {}'.format(portal_owner_id, portal_owner_full_name)
+    RUN_TIMINGS.add('owner lookup', time.perf_counter() - started)
+
+    return service_owner
+
+
+def get_basic_info(portal, grp_feat, gis, owner_directory=None, service_cache=None):
+    """
+        look up the owner and build the report record for an item
+    """
+    service_owner = lookup_service_owner(grp_feat, gis, owner_directory)
+
+    if service_cache is not None:
+        return build_service_record(portal, grp_feat, service_owner, fetch_docloc=service_cache.docloc)
+
+    return build_service_record(portal, grp_feat, service_owner)
+
+
+def build_service_record(portal, grp_feat, service_owner, fetch_docloc=fetch_service_docloc):
+    """
+        build the report record for an item from its attributes, returns None
+        for items left out of the report. fetch_docloc is only called for
+        items that need the service properties
+    """
+
+    handler = item_handler(grp_feat.type)
 
-    print(grp_feat)
     # print(dir(grp_feat))
     # collect/set the variables
     service_id = str(grp_feat.id)
@@ -422,43 +1671,23 @@ def get_basic_info(portal, grp_feat, gis):
                     
             else:
                 service_cats = cat #cat[1:]
-                
-    # get portal user name
-    portal_owner_id = grp_feat.owner
-    portal_owner_user = gis.users.get(username=portal_owner_id)
-    portal_owner_full_name = portal_owner_user.fullName
-    service_owner = '{} - {}'.format(portal_owner_id, portal_owner_full_name)
 
 
-    # Remove well-formed tags, fixing mistakes by legitimate users
-    # no_tags_desc = tag_re.sub('', str(grp_feat.description))
-    no_tags_desc = handle_break(grp_feat.description)
-    no_tags_desc = handle_div(no_tags_desc)
-    no_tags_desc = handle_para(no_tags_desc)
-    no_tags_lic = tag_re.sub('', str(grp_feat.licenseInfo))  
-    # Clean up anything else by escaping
-    service_description = None
-    if no_tags_desc is not None:
-        service_description = html.escape(no_tags_desc)
-    service_license = None
-    if no_tags_lic is not None:
-        service_license = html.escape(no_tags_lic)
+    # single print so the lines stay together when harvesting on worker threads
+    print('{}\n{}\n   {}\n   {}\n   {}'.format(grp_feat, service_title, service_type, service_owner, service_url))
 
-    # search description text for layer, aprx and source
-    lyr_loc = find_el_in_string(no_tags_desc, 'Layer File Location:', 'CRS:')
-    aprx_loc = find_el_in_string(no_tags_desc, 'APRX Location:', 'Layer File Location:')
-    source_loc = find_el_in_string(no_tags_desc, 'Source:', 'Data Class:')
-    date_loc = find_el_in_string(no_tags_desc, 'Data Last Edited:', 'Data Number:')
-    desc_loc = find_el_in_string(no_tags_desc, 'Description:', 'Source:', )
-    data_num_loc = find_el_in_string(no_tags_desc, 'Data Number:', 'APRX Location:')
-    contact_loc = find_el_in_string(no_tags_desc, 'Contact:', 'Portal Owner:')
-    rep_wp_loc = find_el_in_string(no_tags_desc, 'Responsible Work Package:', 'Contact:') 
-    class_loc = find_el_in_string(no_tags_desc, 'Data Class:', 'Revision:') 
-    approve_loc = find_el_in_string(no_tags_desc, 'Data approved by Work Package Manager:', 'Terms of Use:')
-    terms_loc = find_el_in_string(no_tags_desc, 'Terms of Use:')
-    revision_loc = find_el_in_string(no_tags_desc, 'Revision:', 'Data Last Edited:')
-    crs_self_loc = find_el_in_string(no_tags_desc, 'CRS:', 'Responsible Work Package:')
+    # check to see if central is onwer or the service was excluded from analysis manually
+    if handler.apply_exclusions and is_excluded(service_title, service_owner):
+        #print('is owned by {}'.format(service_owner))
+        return None
 
+    # turn the markup into line breaks, fixing mistakes by legitimate users
+    started = time.perf_counter()
+    no_tags_desc = handle_markup(grp_feat.description)
+
+    # search description text for layer, aprx and source
+    desc_fields = parse_description_fields(no_tags_desc)
+    RUN_TIMINGS.add('description parsing', time.perf_counter() - started)
 
     # check if downloadable
     service_downloadable = 'No'
@@ -468,393 +1697,1795 @@ def get_basic_info(portal, grp_feat, gis):
     if service_type == 'Shapefile':
          service_downloadable = 'Yes'    
 
-
-    # empty variables to be filled later
+    # the aprx the service was published from, only for the types that need it
     service_docloc = ''
-    #service_cats = ''
-
-    print(service_title)
-    print('   {}'.format(service_type))
-    print('   {}'.format(service_owner))
-    print('   {}'.format(service_url))
-
-    # filter out maps apps and tools
-    if service_type in ('Web Map', 'WMS', 'Web Mapping Application', 
-                        'Form', 'Table Layer', 'Data Store', 'Dashboard',
-                        'Site Application', 'Geoprocessing Service', 'Code Attachment',
-                        'AppBuilder Extension', 'Scene Package', 'Image Service', 'Scene Service',
-                        'Image', 'Feature Collection', 'Web Scene', 'File Geodatabase',
-                        'Vector Tile Package', 'StoryMap', 'Network Analysis Service', 'WMTS'):
-        #print('is a {}'.format(service_type))
-            out_list = []
-            outlist = [
-                        service_id,
-                        service_title,
-                        service_type, 
-                        service_group, 
-                        '', 
-                        service_created,
-                        service_modifed,
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        service_owner,
-                        '',
-                        service_summary,
-                        desc_loc,
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        terms_loc,
-                        service_tags,
-                        service_cats,
-                        service_status,
-                        service_url,
-                        no_tags_desc
-                        ]
-
-            return outlist
-
-    else:
-        #print('is a {}'.format(service_type))
-        # check to see if central is onwer as this token doesnt have permision to access details
-        
-        if service_owner in ('CentralAdmin', 'CentralAdmin - Central Admin', 'esri_livingatlas', 'esri_livingatlas - Esri'):
-            #print('is owned by {}'.format(service_owner))
-            pass
+    if handler.service_properties:
+        with RUN_TIMINGS.phase('service properties'):
+            service_docloc = fetch_docloc(grp_feat)
+
+    # every field an item can have, the handler picks the ones for its type
+    fields = dict(desc_fields,
+                  service_id=service_id,
+                  title=service_title,
+                  type=service_type,
+                  group=service_group,
+                  downloadable=service_downloadable,
+                  created=service_created,
+                  modified=service_modifed,
+                  owner=service_owner,
+                  summary=service_summary,
+                  aprx_uploaded_from=service_docloc,
+                  crs_service=service_crs,
+                  tags=service_tags,
+                  categories=service_cats,
+                  status=service_status,
+                  url=service_url,
+                  raw_description=no_tags_desc)
+
+    # create the report record
+    return ServiceRecord(**{attr: fields[attr] for attr in handler.fields})
+
+
+class XlsxReportSink(object):
+    """
+        writes report rows straight into an xlsx workbook in xlsxwriter's
+        constant memory mode, each row is flushed to disk as the next one starts.
+        The workbook is built under a temporary name and only replaces the
+        previous report once it is closed. Until then the rows are also kept in
+        a json lines file beside it, so a run that dies part way leaves the rows
+        written so far
+    """
 
-        # this is a permisions error I cannot get around
-        elif service_title in('Ops_Dash_Master_Layers_Forecast', 
-                            'Ops_Dash_Master_Layers_Temperature', 
-                            'Ops_Dash_Master_Layers_Wave',
-                            'Ops_Dash_Master_Layers_Wind') and service_owner == 'wamvg6':
-            #print('excluded from analysis manually')
-            #print('is owned by {}'.format(service_owner))
-            pass
-        elif service_type == 'Shapefile':
-            # create list of outputs
-            out_list = []
-            outlist = [
-                        service_id,
-                        service_title,
-                        service_type, 
-                        service_group, 
-                        service_downloadable, 
-                        service_created,
-                        service_modifed,
-                        date_loc,
-                        revision_loc,
-                        data_num_loc,
-                        class_loc,
-                        source_loc,
-                        contact_loc,
-                        rep_wp_loc,
-                        service_owner,
-                        approve_loc,
-                        service_summary,
-                        desc_loc,
-                        '',
-                        aprx_loc,
-                        lyr_loc,
-                        service_crs,
-                        crs_self_loc,
-                        terms_loc,
-                        service_tags,
-                        service_cats,
-                        service_status,
-                        service_url,
-                        no_tags_desc
-                        ]
-
-
-            return outlist
-        else:
-            #print('is owned by {}'.format(service_owner))
-            try:
-                grp_feat_flc = FeatureLayerCollection.fromitem(grp_feat)
-            except:
-                grp_feat_flc = 'None'
-            # print(grp_feat_flc.properties)
+    def __init__(self, out_path, sheet_names, columns):
+        self.out_path = out_path
+        import xlsxwriter
+
+        self.temp_path = out_path + '.tmp.xlsx'
+        self.rows_sink = JsonLinesReportSink(self.temp_path, sheet_names, columns)
+        self.workbook = xlsxwriter.Workbook(self.temp_path, {'constant_memory': True, 'strings_to_formulas': False})
+        header_format = self.workbook.add_format({'bold': True, 'bg_color': '#999999', 'border': 1})
+
+        self.worksheets = {}
+        self.row_counts = {}
+        for sheet_name in sheet_names:
+            worksheet = self.workbook.add_worksheet(sheet_name)
+            worksheet.set_column(0, len(columns) - 1, 20)
+            worksheet.freeze_panes(1, 0)
+            worksheet.write_row(0, 0, columns, header_format)
+            self.worksheets[sheet_name] = worksheet
+            self.row_counts[sheet_name] = 1
+        self.column_count = len(columns)
+
+    def write(self, sheet_name, values):
+        row = self.row_counts[sheet_name]
+        self.worksheets[sheet_name].write_row(row, 0, values)
+        self.row_counts[sheet_name] = row + 1
+        self.rows_sink.write(sheet_name, values)
+
+    def close(self):
+        for sheet_name, worksheet in self.worksheets.items():
+            worksheet.autofilter(0, 0, self.row_counts[sheet_name] - 1, self.column_count - 1)
+        self.workbook.close()
+        os.replace(self.temp_path, self.out_path)
+
+        # the workbook is complete, the rows kept for a failed run are not needed
+        self.rows_sink.close()
+        os.remove(self.rows_sink.file.name)
+
+
+class CsvReportSink(object):
+    """
+        writes report rows to a csv file per sheet, line buffered so the rows
+        are on disk as soon as they are written
+    """
 
-            # to get description from the actual metadata from the uploaded data rather than service
-            # service_summary = grp_feat_flc.properties.serviceDescription
-            # service_description = grp_feat_flc.properties.description
-            
-            try:
-                service_docloc = grp_feat_flc.properties.documentInfo.Title
-            except:
-                service_docloc = 'None'
-
-            # try:
-            #     service_cats = grp_feat_flc.properties.documentInfo.Category
-            # except:
-            #     service_cats = 'None'
-
-            # create list of outputs
-            out_list = []
-            outlist = [
-                        service_id,
-                        service_title,
-                        service_type, 
-                        service_group, 
-                        service_downloadable, 
-                        service_created,
-                        service_modifed,
-                        date_loc,
-                        revision_loc,
-                        data_num_loc,
-                        class_loc,
-                        source_loc,
-                        contact_loc,
-                        rep_wp_loc,
-                        service_owner,
-                        approve_loc,
-                        service_summary,
-                        desc_loc,
-                        service_docloc,
-                        aprx_loc,
-                        lyr_loc,
-                        service_crs,
-                        crs_self_loc,
-                        terms_loc,
-                        service_tags,
-                        service_cats,
-                        service_status,
-                        service_url,
-                        no_tags_desc
-                        ]
-
-
-            return outlist
-
-
-def format_excel(xl_path, sheet_name, row_count, col_count):
-    writer = pd.ExcelWriter(xl_path, engine='xlsxwriter')
-
-    # Get the xlsxwriter workbook and worksheet objects.
-    workbook  = writer.book
-    worksheet = writer.sheets[sheet_name]
-
-    cell_format = workbook.add_format({'bold': True, 'font_color': 'red'})
-    cell_format = workbook.set_border(style=1)
-    title_format = workbook.add_format({'bold': True, 'bg_color': '#999999'})
-
-    start_row = 1
-    start_col = 1
-    end_row = row_count
-    end_col = col_count
-    worksheet.conditional_format(start_row, start_col, end_row, end_col, {'format':   cell_format})
-    worksheet.conditional_format(start_row, start_col, start_row, end_col, {'format':   title_format})
-
-    writer.save()
-
-
-
-def run_extract_info(excel_report_output):
-
-    # credentails
-    pw = "pw"
-    un = "un"
-
-    portal = r"https://onemap-northsea-uk.bpglobal.com/portal"
-
-     # create basic structure
-    df_proc_export = pd.DataFrame(columns=['Service ID',
-                                            'Title',
-                                            'Type',
-                                            'Group',
-                                            'Downloadable',
-                                            'Date Created',
-                                            'Date Last Modified',
-                                            'Date Data Was Lasted Edited',
-                                            'Revision',
-                                            'Data Number',
-                                            'Class (1-4)',
-                                            'Source',
-                                            'Contact(s)',
-                                            'Responsible WP',
-                                            'Portal Owner',
-                                            'Data approved by WPM',
-                                            'Summary',
-                                            'Description',
-                                            'APRX Uploaded From',
-                                            'APRX Location',
-                                            'Layer File Location',
-                                            'CRS Service',
-                                            'CRS Self Reported',
-                                            'Terms of Use',
-                                            'Tags', 
-                                            'Categories',
-                                            'Status',
-                                            'URL',
-                                            'Raw Description'])   
-
-
-    # Log in to the portal
-    print('login in...')
-    gis = GIS(portal, un, pw)
-
-    # loop through these groups, not all the portal
-    portal_list = (['Morgan and Mona'])
-    print(portal_list)
-
-    for portal in portal_list:
-        # get the group information
-        grp = gis.groups.search('title:{}'.format(portal))
-        print(grp)
-        # loop through features in group
-        grp_items = grp[0].content()
-        for grp_feat in grp_items:
-            service_id = str(grp_feat.id)
+    def __init__(self, out_path, sheet_names, columns):
+        base_path = os.path.splitext(out_path)[0]
+        self.files = {}
+        self.writers = {}
+        for sheet_name in sheet_names:
+            sheet_file = open('{}_{}.csv'.format(base_path, sheet_name.replace(' ', '_')), 'w',
+                              newline='', encoding='utf-8', buffering=1)
+            self.files[sheet_name] = sheet_file
+            self.writers[sheet_name] = csv.writer(sheet_file)
+            self.writers[sheet_name].writerow(columns)
 
-            feat_info = get_basic_info(portal, grp_feat, gis)
-            
-            # append data to the dataframe
-            if feat_info is None:
-                pass
-            else:
-                df_proc_export = df_proc_export.append(
-                                                        {'Service ID': feat_info[0],
-                                                        'Title': feat_info[1],
-                                                        'Type': feat_info[2],
-                                                        'Group': feat_info[3],
-                                                        'Downloadable': feat_info[4],
-                                                        'Date Created': feat_info[5],
-                                                        'Date Last Modified': feat_info[6],
-                                                        'Date Data Was Lasted Edited': feat_info[7],
-                                                        'Revision': feat_info[8],
-                                                        'Data Number': feat_info[9],
-                                                        'Class (1-4)': feat_info[10],
-                                                        'Source': feat_info[11],
-                                                        'Contact(s)': feat_info[12],
-                                                        'Responsible WP': feat_info[13],
-                                                        'Portal Owner': feat_info[14],
-                                                        'Data approved by WPM': feat_info[15],
-                                                        'Summary': feat_info[16],
-                                                        'Description': feat_info[17],
-                                                        'APRX Uploaded From': feat_info[18],
-                                                        'APRX Location': feat_info[19],
-                                                        'Layer File Location': feat_info[20],
-                                                        'CRS Service': feat_info[21],
-                                                        'CRS Self Reported': feat_info[22],
-                                                        'Terms of Use': feat_info[23],
-                                                        'Tags': feat_info[24],
-                                                        'Categories': feat_info[25],
-                                                        'Status': feat_info[26],
-                                                        'URL': feat_info[27],
-                                                        'Raw Description': feat_info[28]}, ignore_index=True)
+    def write(self, sheet_name, values):
+        self.writers[sheet_name].writerow(values)
 
-        
-        # with pd.option_context('display.max_rows', None, 'display.max_columns', None):
-        #    print(df_proc_export)
+    def close(self):
+        for sheet_file in self.files.values():
+            sheet_file.close()
 
 
-    # filter the dataframe
-    service_tag_list = ['Map Service', 'Feature Service', 'WMS', 'WMTS']
-    df_proc_services = df_proc_export[df_proc_export.Type.isin(service_tag_list)]
+class JsonLinesReportSink(object):
+    """
+        writes report rows as json objects, one per line, with the sheet name
+    """
 
-    downloads_tag_list = ['Shapefile']
-    df_proc_downloads = df_proc_export[df_proc_export.Type.isin(downloads_tag_list)]    
+    def __init__(self, out_path, sheet_names, columns):
+        self.columns = columns
+        self.file = open(os.path.splitext(out_path)[0] + '.jsonl', 'w', encoding='utf-8', buffering=1)
 
-    maps_tag_list = ['Web Map']
-    df_proc_maps = df_proc_export[df_proc_export.Type.isin(maps_tag_list)]    
+    def write(self, sheet_name, values):
+        row = dict(zip(self.columns, values))
+        row['Sheet'] = sheet_name
+        self.file.write(json.dumps(row) + '\n')
 
-    tools_tag_list = ['Site Application', 'Web Mapping Application', 'Code Attachment', 'Geoprocessing Service', 'Dashboard', 'Form', 'Data Store']
-    df_proc_tools = df_proc_export[df_proc_export.Type.isin(tools_tag_list)]   
+    def close(self):
+        self.file.close()
 
-    writer = pd.ExcelWriter(excel_report_output)
-    df_proc_services.to_excel(writer, sheet_name = 'Services', index=False, header=True)
-    df_proc_downloads.to_excel(writer, sheet_name = 'Downloadable', index=False, header=True)
-    df_proc_maps.to_excel(writer, sheet_name = 'Maps', index=False, header=True)
-    df_proc_tools.to_excel(writer, sheet_name = 'Apps and Tools', index=False, header=True)
-    writer.save()
 
-def rename_and_copy(excel_report_output, out_folder):
+REPORT_SINKS = {
+    'xlsx': XlsxReportSink,
+    'csv': CsvReportSink,
+    'jsonl': JsonLinesReportSink,
+}
 
 
-    rename_excel_report_output = ''
-    prev_week_info = ''
+class ReportWriter(object):
+    """
+        routes each record to its report sheet and writes it to every sink as it is produced
+    """
 
-    if os.path.isfile(excel_report_output):
-        print('Make copy and rename')
-        # get date and week for report output name (date last modified)
-        date_mod = datetime.datetime.fromtimestamp(os.path.getmtime(excel_report_output))
-        yyyy_date = date_mod.strftime('%Y%m%d')
-        week_no = date_mod.isocalendar()[1]
-        ms = date_mod.strftime('%H%M')
-        prev_week_info = '{}_{}_Week_{}'.format(yyyy_date, ms, week_no)
+    def __init__(self, out_path, sink_names=('xlsx',)):
+        self.sinks = [REPORT_SINKS[sink_name](out_path, list(REPORT_SHEETS), REPORT_COLUMNS) for sink_name in sink_names]
 
-        # make a copy of the report with new name
-        rename_out_file_name = '{}_MoMo_MetaDataReport.xlsx'.format(prev_week_info)
-        rename_excel_report_output = os.path.join(out_folder,rename_out_file_name)
-        #os.rename(excel_report_output, rename_excel_report_output)
-        shutil.copy(excel_report_output,rename_excel_report_output)
-    
-    return rename_excel_report_output, prev_week_info
+    def write_record(self, record):
+        sheet_name = REPORT_SHEET_BY_TYPE.get(record.type)
+        if sheet_name is None:
+            return
 
+        values = record.values()
+        for sink in self.sinks:
+            sink.write(sheet_name, values)
 
-def run_comparison_info(excel_report_output, rename_excel_report_output, prev_week_info, out_comp_folder):
-    # Run the comparison
-    # get current data info
-    date_mod = datetime.datetime.fromtimestamp(os.path.getmtime(excel_report_output))
-    yyyy_date = date_mod.strftime('%Y%m%d')
-    week_no = date_mod.isocalendar()[1]
-    ms = date_mod.strftime('%H%M')
-    cur_week_info = '{}_{}_Week_{}'.format(yyyy_date, ms, week_no)
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
 
 
-    # report output
-    os.path.join(out_comp_folder, '{}_Compairson_{}.xlsx'.format(cur_week_info, prev_week_info))
-    excel_export_comparison = os.path.join(out_comp_folder, '{}_Compairson_{}.xlsx'.format(cur_week_info, prev_week_info))
+def extract_item(portal, grp_feat, gis, owner_directory=None, record_store=None, service_cache=None):
+    """
+        get the report record for an item, reusing the stored record when the
+        item has not been modified since the last run
+    """
+    started = time.perf_counter()
+    if record_store is not None:
+        found, record = record_store.lookup(grp_feat)
+        if found:
+            if record is not None:
+                record.group = portal
+            RUN_TIMINGS.item(grp_feat, time.perf_counter() - started, 'record store')
+            return record
 
+    record = get_basic_info(portal, grp_feat, gis, owner_directory, service_cache)
 
-    # compare the excels on a certain sheet
-    writer = pd.ExcelWriter(excel_export_comparison)
-    compare_excel(excel_report_output, rename_excel_report_output, 'Services', writer)
-    compare_excel(excel_report_output, rename_excel_report_output, 'Downloadable', writer)   
-    writer.save()
-    
-    return excel_export_comparison
+    if record_store is not None:
+        record_store.store(grp_feat, record)
 
-# Main Function
-def main():
-    
-    # get date and week for report output name
-    # report output
-    #excel_report_output = r'C:\Users\9325pb\OneDrive - BP\NorthSea\MoMo\Data\Portal Data Links\Weekly List\{}_Week_{}_MoMo_MetaDataReport.xlsx'.format(yyyy_date, week_no)
-    out_folder_weekly = r'\\aadanfusw0-fb3b\Digital\dataWorx\Geospatial\Region\NorthSea\Geospatial\Scratch\GMcLachlan\Projects\MoMo\Docs\Data_Lists\Weekly_Lists'
-    out_folder_main = r'\\aadanfusw0-fb3b\Digital\dataWorx\Geospatial\Region\NorthSea\Geospatial\Scratch\GMcLachlan\Projects\MoMo\Docs\Data_Lists\Meta_Data_Report'
-    out_file_name = 'MoMo_MetaDataReport.xlsx'
-    out_comp_folder =  r'\\aadanfusw0-fb3b\Digital\dataWorx\Geospatial\Region\NorthSea\Geospatial\Scratch\GMcLachlan\Projects\MoMo\Docs\Data_Lists\Comparison_List'
-
-    # the full metadata report location
-    excel_report_output = os.path.join(out_folder_main,out_file_name)
-    
-    # create a copy of current report, renaming it
-    rename_excel_report_output, prev_week_info = rename_and_copy(excel_report_output, out_folder_weekly)
+    RUN_TIMINGS.item(grp_feat, time.perf_counter() - started, 'portal')
+    return record
 
-    # extract the new 
-    run_extract_info(excel_report_output)
 
-    # run comparison
-    excel_export_comparison = run_comparison_info(excel_report_output, rename_excel_report_output, prev_week_info, out_comp_folder)
-    
+def find_groups(gis, group_titles=None, group_query=None, whole_portal=False):
+    """
+        the portal groups to crawl, from a list of group titles, a group
+        search query or every group in the portal
+    """
+    started = time.perf_counter()
+    if whole_portal:
+        groups = PORTAL_CALLS.call('groups.search', gis.groups.search, '*', max_groups=10000)
+    elif group_query is not None:
+        groups = PORTAL_CALLS.call('groups.search', gis.groups.search, group_query, max_groups=10000)
+    else:
+        groups = []
+        for group_title in group_titles:
+            # the search is fuzzy, use the group with the exact title if there is one
+            found = PORTAL_CALLS.call('groups.search', gis.groups.search, 'title:{}'.format(group_title))
+            exact = [grp for grp in found if grp.title == group_title]
+            if exact:
+                groups.append(exact[0])
+            elif found:
+                groups.append(found[0])
+            else:
+                print('no group found for {}'.format(group_title))
 
+    # a group can be found by more than one title
+    unique_groups = {}
+    for grp in groups:
+        unique_groups.setdefault(grp.id, grp)
+    RUN_TIMINGS.add('group search', time.perf_counter() - started)
 
-if __name__ == "__main__":
-    
-    print('starting analysis')
-    now = datetime.datetime.now()
-    print("time started:", now)
+    return list(unique_groups.values())
+
+
+def search_item(gis, item_json):
+    """
+        an arcgis Item from a search result without another request for it,
+        a wrapped gis makes its own items
+    """
+    item_from_search = getattr(gis, 'item_from_search', None)
+    if item_from_search is not None:
+        return item_from_search(item_json)
+
+    load_arcgis()
+    from arcgis.gis import Item
+
+    return Item(gis, item_json['id'], item_json)
+
+
+def search_group_items(gis, grp, search_filter):
+    """
+        the items in a group that pass the search filter, paged through the
+        portal search. Items are only made for the results that are kept
+    """
+    query = search_filter.query(grp.id)
+    grp_items = []
+    start = 1
+    while start > 0:
+        page = PORTAL_CALLS.call('group.search', gis.content.advanced_search, query,
+                                 max_items=search_filter.page_size, start=start, as_dict=True)
+        grp_items.extend(search_item(gis, item_json) for item_json in page['results'] if search_filter.keep(item_json))
+        start = page.get('nextStart', -1)
+
+    return grp_items
+
+
+def crawl_groups(groups, max_workers=1, gis=None, search_filter=None):
+    """
+        list the content of the groups, in parallel, and return each unique item
+        once with the titles of all the groups it is shared to.
+        Items keep the order they are first seen in, going through the groups in order.
+        With a search filter the groups are searched rather than listed in full
+    """
+    def list_content(grp):
+        if search_filter is not None:
+            return search_group_items(gis, grp, search_filter)
+        return PORTAL_CALLS.call('group.content', grp.content)
+
+    with RUN_TIMINGS.phase('content listing'):
+        if max_workers is None or max_workers <= 1:
+            group_contents = [list_content(grp) for grp in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                group_contents = list(executor.map(list_content, groups))
+
+    return dedupe_group_items([grp.title for grp in groups], group_contents)
+
+
+def dedupe_group_items(group_titles, group_contents):
+    """
+        each unique item once, in the order they are first seen, with the
+        titles of all the groups it is in
+    """
+    crawled = {}
+    for group_title, grp_items in zip(group_titles, group_contents):
+        print('{}: {} items'.format(group_title, len(grp_items)))
+        for grp_feat in grp_items:
+            if grp_feat.id in crawled:
+                crawled[grp_feat.id][1].append(group_title)
+            else:
+                crawled[grp_feat.id] = (grp_feat, [group_title])
+
+    print('{} unique items in {} groups'.format(len(crawled), len(group_titles)))
+
+    # group membership is recorded as a comma separated list, like the tags
+    return [(grp_feat, ','.join(group_titles)) for grp_feat, group_titles in crawled.values()]
+
+
+def harvest_items(crawled_items, gis, max_workers=1, owner_directory=None, record_store=None, service_cache=None):
+    """
+        run extract_item over the crawled (item, groups) pairs, yielding the
+        results in the same order as the crawl.
+        With max_workers above 1 the items are fetched on a bounded pool of
+        worker threads, at most 2 x max_workers items are in flight at once
+    """
+
+    # serial path
+    if max_workers is None or max_workers <= 1:
+        for grp_feat, portal in crawled_items:
+            yield extract_item(portal, grp_feat, gis, owner_directory, record_store, service_cache)
+        return
+
+    # results are taken from the front of the queue so the order matches the serial path
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for grp_feat, portal in crawled_items:
+            pending.append(executor.submit(extract_item, portal, grp_feat, gis, owner_directory,
+                                           record_store, service_cache))
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def fetch_raw_item(portal, grp_feat, gis, owner_directory=None, record_store=None, service_cache=None):
+    """
+        the network stage of the pipeline. Returns (True, record) for an item
+        reused from the record store, otherwise (False, raw) with the item
+        attributes, the owner and the service properties looked up, ready to
+        be built into a record in another process
+    """
+    if record_store is not None:
+        found, record = record_store.lookup(grp_feat)
+        if found:
+            if record is not None:
+                record.group = portal
+            return True, record
+
+    service_owner = lookup_service_owner(grp_feat, gis, owner_directory)
+
+    service_docloc = ''
+    if needs_service_properties(grp_feat.type, grp_feat.title, service_owner):
+        fetch_docloc = service_cache.docloc if service_cache is not None else fetch_service_docloc
+        with RUN_TIMINGS.phase('service properties'):
+            service_docloc = fetch_docloc(grp_feat)
+
+    raw = {'portal': portal,
+           'attributes': {attr: getattr(grp_feat, attr) for attr in RestItem.__slots__},
+           'service_owner': service_owner,
+           'docloc': service_docloc}
+
+    return False, raw
+
+
+def build_raw_record(raw):
+    """
+        the cpu stage of the pipeline, run in a worker process. Cleans the description
+        and builds the record, returning it with the phase timings of the build
+    """
+    RUN_TIMINGS.reset()
+    record = build_service_record(raw['portal'], ReplayItem(raw['attributes']), raw['service_owner'],
+                                  fetch_docloc=lambda grp_feat: raw['docloc'])
+
+    return record, RUN_TIMINGS.phases
+
+
+def pipeline_items(crawled_items, gis, max_workers=1, parse_workers=2, owner_directory=None,
+                   record_store=None, service_cache=None):
+    """
+        harvest_items as a staged pipeline so the network and the cpu are both kept busy.
+        Fetch threads do the portal lookups, a pool of parse_workers processes cleans the
+        descriptions and builds the records, and the records are yielded in crawl order.
+        Each item moves to the process pool as soon as it is fetched, at most
+        2 x (max_workers + parse_workers) items are in the pipeline at once
+    """
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    fetch_workers = max(1, max_workers or 1)
+    process_pool = ProcessPoolExecutor(max_workers=parse_workers)
+    # start the worker processes before any threads, forking a process with threads running can hang it
+    process_pool.submit(int).result()
+
+    def start(grp_feat, portal):
+        started = time.perf_counter()
+        item_future = Future()
+
+        def built(build_future):
+            try:
+                record, phases = build_future.result()
+            except BaseException as error:
+                item_future.set_exception(error)
+                return
+            item_future.set_result((False, record, phases, started))
+
+        def fetched(fetch_future):
+            try:
+                found, result = fetch_future.result()
+                if found:
+                    item_future.set_result((True, result, None, started))
+                else:
+                    process_pool.submit(build_raw_record, result).add_done_callback(built)
+            except BaseException as error:
+                item_future.set_exception(error)
+
+        fetch_pool.submit(fetch_raw_item, portal, grp_feat, gis, owner_directory,
+                          record_store, service_cache).add_done_callback(fetched)
+        return item_future
+
+    def finish(grp_feat, item_future):
+        # the sink stage, back on the calling thread
+        found, record, phases, started = item_future.result()
+        if not found:
+            RUN_TIMINGS.merge(phases)
+            if record_store is not None:
+                record_store.store(grp_feat, record)
+        RUN_TIMINGS.item(grp_feat, time.perf_counter() - started, 'record store' if found else 'portal')
+        return record
+
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool:
+            for grp_feat, portal in crawled_items:
+                pending.append((grp_feat, start(grp_feat, portal)))
+                if len(pending) >= 2 * (fetch_workers + parse_workers):
+                    yield finish(*pending.popleft())
+
+            while pending:
+                yield finish(*pending.popleft())
+    finally:
+        process_pool.shutdown(cancel_futures=True)
+
+
+def harvest_with_journal(crawled_items, journal, harvest, record_store=None):
+    """
+        yield the records for the crawled (item, groups) pairs in crawl order,
+        taking items completed before a restart from the journal and passing
+        the rest to harvest, which yields their records in order.
+        Every record is journaled as it comes through
+    """
+    journaled = []
+    to_harvest = []
+    for grp_feat, portal in crawled_items:
+        found, record = journal.lookup(grp_feat)
+        journaled.append((found, record))
+        if not found:
+            to_harvest.append((grp_feat, portal))
+
+    harvested = harvest(to_harvest)
+    try:
+        for position, ((grp_feat, portal), (found, record)) in enumerate(zip(crawled_items, journaled)):
+            if found:
+                if record is not None:
+                    record.group = portal
+                # keep the record store complete for the next run
+                if record_store is not None:
+                    record_store.keep(grp_feat, record)
+            else:
+                record = next(harvested)
+            journal.append(position, grp_feat, record)
+            yield record
+    finally:
+        # whatever happens the completed records are on disk for the restart
+        journal.close()
+
+
+def split_report_sheets(df_report, sheet_names=None):
+    """
+        split the report dataframe into the report sheets by item type, in one grouping pass
+    """
+    if sheet_names is None:
+        sheet_names = list(REPORT_SHEETS)
+
+    # types with no sheet group under null and are dropped
+    df_by_sheet = dict(tuple(df_report.groupby(df_report['Type'].map(REPORT_SHEET_BY_TYPE), sort=False)))
+
+    return {sheet_name: df_by_sheet.get(sheet_name, df_report.iloc[0:0]) for sheet_name in sheet_names}
+
+
+class RestItem(object):
+    """
+        portal item read from the sharing rest api, with the same attributes
+        build_service_record reads from an arcgis Item
+    """
+
+    __slots__ = ('id', 'title', 'type', 'tags', 'modified', 'created', 'snippet', 'spatialReference',
+                 'categories', 'content_status', 'owner', 'description', 'licenseInfo', 'url')
+
+    def __init__(self, item_json):
+        self.id = item_json['id']
+        self.title = item_json.get('title')
+        self.type = item_json.get('type')
+        self.tags = item_json.get('tags') or []
+        self.modified = item_json.get('modified')
+        self.created = item_json.get('created')
+        self.snippet = item_json.get('snippet')
+        self.spatialReference = item_json.get('spatialReference')
+        self.categories = item_json.get('categories') or []
+        self.owner = item_json.get('owner')
+        self.description = item_json.get('description')
+        self.licenseInfo = item_json.get('licenseInfo')
+        self.url = item_json.get('url')
+
+        # same values as Item.content_status
+        content_status = item_json.get('contentStatus') or ''
+        if 'authoritative' in content_status:
+            self.content_status = 'authoritative'
+        elif content_status == 'deprecated':
+            self.content_status = 'deprecated'
+        else:
+            self.content_status = None
+
+    def __repr__(self):
+        return '<Item title:"{}" type:{} owner:{}>'.format(self.title, self.type, self.owner)
+
+
+class InvalidToken(RuntimeError):
+    """
+        the portal refused the token, it expired or does not match the referer
+    """
+
+
+class RestPortalClient(object):
+    """
+        talks to the portal sharing rest endpoints over one aiohttp session,
+        the connections are pooled and kept alive and at most max_concurrency
+        requests are in flight at once
+    """
+
+    page_size = 100
+    # minutes a token lasts, it is renewed this many seconds before it runs out
+    token_expiration = 120
+    token_margin = 300
+    # the portal answers an expired or invalid token with one of these codes
+    token_error_codes = (498, 499)
+
+    def __init__(self, session, portal_url, max_concurrency):
+        self.session = session
+        self.portal_url = portal_url.rstrip('/')
+        self.rest_url = self.portal_url + '/sharing/rest'
+        import asyncio
+
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.login_lock = asyncio.Lock()
+        self.token = None
+        self.token_expires = None
+        self.credentials = None
+
+    def token_stale(self):
+        return (self.credentials is not None and
+                (self.token_expires is None or time.time() >= self.token_expires - self.token_margin))
+
+    async def renew_token(self):
+        """
+            log in again, once for all the requests that found the token stale
+        """
+        async with self.login_lock:
+            if self.token_stale():
+                await self.login(*self.credentials)
+
+    async def get_json(self, url, params=None, method='GET', endpoint='rest'):
+        """
+            a sharing rest request, retried like the arcgis portal calls and
+            recorded against the endpoint in PORTAL_CALLS
+        """
+        import asyncio
+
+        params = dict(params or {}, f='json')
+
+        attempt = 0
+        renewed = False
+        while True:
+            if endpoint != 'generateToken' and self.token_stale():
+                await self.renew_token()
+            if self.token is not None and endpoint != 'generateToken':
+                params['token'] = self.token
+
+            async with self.semaphore:
+                started = time.perf_counter()
+                try:
+                    if method == 'POST':
+                        request = self.session.post(url, data=params)
+                    else:
+                        request = self.session.get(url, params=params)
+                    async with request as response:
+                        status = response.status
+                        if status not in self.token_error_codes:
+                            response.raise_for_status()
+                            result = await response.json(content_type=None)
+                            # the portal reports most errors in the body
+                            if 'error' in result:
+                                status = result['error'].get('code', status)
+                    if status in self.token_error_codes:
+                        raise InvalidToken('{} failed: invalid token ({})'.format(url, status))
+                    if 'error' in result:
+                        raise RuntimeError('{} failed: {}'.format(url, result['error']))
+                except InvalidToken as error:
+                    PORTAL_CALLS.record(endpoint, time.perf_counter() - started)
+                    # the token ran out mid run, log in again and retry straight away
+                    if renewed or self.credentials is None or endpoint == 'generateToken':
+                        raise
+                    renewed = True
+                    if self.token == params.get('token'):
+                        self.token_expires = None
+                    continue
+                except Exception as error:
+                    PORTAL_CALLS.record(endpoint, time.perf_counter() - started)
+                    delay = PORTAL_CALLS.retry_delay(endpoint, error, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    PORTAL_CALLS.record(endpoint, time.perf_counter() - started)
+                    return result
+
+            # wait outside the semaphore so other requests can go ahead
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def login(self, username, password):
+        """
+            a referer token, the session sends the matching Referer header on
+            every request and the token is renewed before it expires
+        """
+        result = await self.get_json(self.rest_url + '/generateToken',
+                                     {'username': username, 'password': password,
+                                      'client': 'referer', 'referer': self.portal_url,
+                                      'expiration': self.token_expiration},
+                                     method='POST', endpoint='generateToken')
+        self.credentials = (username, password)
+        self.token = result['token']
+        # the portal gives the expiry in epoch milliseconds
+        expires = result.get('expires')
+        self.token_expires = expires / 1000.0 if expires else time.time() + self.token_expiration * 60
+
+    async def paged(self, url, params, endpoint):
+        """
+            all the results of a paged search
+        """
+        results = []
+        start = 1
+        while start > 0:
+            page = await self.get_json(url, dict(params, start=start, num=self.page_size), endpoint=endpoint)
+            results.extend(page['results'])
+            start = page.get('nextStart', -1)
+
+        return results
+
+    async def search_groups(self, query):
+        return await self.paged(self.rest_url + '/community/groups', {'q': query}, 'groups.search')
+
+    async def group_items(self, group_id, search_filter=None):
+        import asyncio
+
+        if search_filter is None:
+            item_jsons = await self.paged(self.rest_url + '/search', {'q': 'group:{}'.format(group_id)}, 'group.content')
+        else:
+            item_jsons = await self.paged(self.rest_url + '/search', {'q': search_filter.query(group_id)}, 'group.search')
+            item_jsons = [item_json for item_json in item_jsons if search_filter.keep(item_json)]
+
+        # some portals leave the description out of search results, get those from the item
+        missing = [position for position, item_json in enumerate(item_jsons) if 'description' not in item_json]
+        if missing:
+            details = await asyncio.gather(*[self.get_json(self.rest_url + '/content/items/{}'.format(item_jsons[position]['id']),
+                                                           endpoint='items.get')
+                                             for position in missing])
+            for position, item_json in zip(missing, details):
+                item_jsons[position] = item_json
+
+        return [RestItem(item_json) for item_json in item_jsons]
+
+    async def user_full_name(self, username):
+        user = await self.get_json(self.rest_url + '/community/users/{}'.format(username), endpoint='users.get')
+        return user.get('fullName')
+
+    async def service_docloc(self, service_url):
+        # same fallback as fetch_service_docloc
+        try:
+            service_properties = await self.get_json(service_url, endpoint='service properties')
+        except Exception as error:
+            print('no service properties for {}: {}'.format(service_url, error))
+            return DOCLOC_UNAVAILABLE
+
+        try:
+            return service_properties['documentInfo']['Title']
+        except (KeyError, TypeError):
+            return 'None'
+
+    async def timed_service_docloc(self, service_url):
+        started = time.perf_counter()
+        docloc = await self.service_docloc(service_url)
+        return docloc, time.perf_counter() - started
+
+
+async def harvest_rest_async(portal_url, username, password, group_titles=('Morgan and Mona',), group_query=None,
+                             whole_portal=False, max_concurrency=16, owner_directory=None, record_store=None,
+                             service_cache=None, search_filter=None):
+    """
+        the rest equivalent of find_groups, crawl_groups and harvest_items, returns
+        the records (None for items left out) in the same order as the arcgis backend
+    """
+    import asyncio
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    # the token is issued for the portal referer, so every request has to carry it
+    async with aiohttp.ClientSession(connector=connector, headers={'Referer': portal_url.rstrip('/')}) as session:
+        client = RestPortalClient(session, portal_url, max_concurrency)
+        with RUN_TIMINGS.phase('login'):
+            await client.login(username, password)
+
+        # find the groups, by exact title where there is one like find_groups
+        started = time.perf_counter()
+        if whole_portal:
+            groups = await client.search_groups('*')
+        elif group_query is not None:
+            groups = await client.search_groups(group_query)
+        else:
+            found_groups = await asyncio.gather(*[client.search_groups('title:{}'.format(group_title)) for group_title in group_titles])
+            groups = []
+            for group_title, found in zip(group_titles, found_groups):
+                exact = [grp for grp in found if grp['title'] == group_title]
+                if exact or found:
+                    groups.append((exact or found)[0])
+                else:
+                    print('no group found for {}'.format(group_title))
+        unique_groups = {}
+        for grp in groups:
+            unique_groups.setdefault(grp['id'], grp)
+        groups = list(unique_groups.values())
+        RUN_TIMINGS.add('group search', time.perf_counter() - started)
+
+        # list the groups and keep each unique item once
+        with RUN_TIMINGS.phase('content listing'):
+            group_contents = await asyncio.gather(*[client.group_items(grp['id'], search_filter) for grp in groups])
+        crawled_items = dedupe_group_items([grp['title'] for grp in groups], group_contents)
+
+        # unchanged items reuse their stored record
+        records = [None] * len(crawled_items)
+        to_build = []
+        for position, (grp_feat, portal) in enumerate(crawled_items):
+            found = False
+            if record_store is not None:
+                found, record = record_store.lookup(grp_feat)
+            if found:
+                if record is not None:
+                    record.group = portal
+                records[position] = record
+            else:
+                to_build.append((position, grp_feat, portal))
+
+        # look up each unknown owner once
+        if owner_directory is None:
+            owner_directory = OwnerDirectory(None)
+        owners = set(grp_feat.owner for position, grp_feat, portal in to_build)
+        unknown_owners = sorted(owners - set(owner_directory.full_names))
+        with RUN_TIMINGS.phase('owner lookup'):
+            full_names = await asyncio.gather(*[client.user_full_name(owner) for owner in unknown_owners])
+        owner_directory.full_names.update(zip(unknown_owners, full_names))
+        owner_directory.misses += len(unknown_owners)
+        owner_directory.hits += len(to_build) - len(unknown_owners)
+
+        def service_owner_of(grp_feat):
+            return '{} - {}'.format(grp_feat.owner, owner_directory.full_names[grp_feat.owner])
+
+        # service properties for the items that need them, cached ones are not fetched again
+        # and the rest are fetched all at once as the rest api has no batch request for them
+        if service_cache is None:
+            service_cache = ServicePropertiesCache()
+        docloc_by_id = {}
+        need_docloc = []
+        for position, grp_feat, portal in to_build:
+            if needs_service_properties(grp_feat.type, grp_feat.title, service_owner_of(grp_feat)):
+                found, docloc = service_cache.lookup(grp_feat)
+                if found:
+                    docloc_by_id[grp_feat.id] = docloc
+                else:
+                    need_docloc.append(grp_feat)
+        with RUN_TIMINGS.phase('service properties'):
+            fetched = await asyncio.gather(*[client.timed_service_docloc(grp_feat.url) for grp_feat in need_docloc])
+        for grp_feat, (docloc, fetch_seconds) in zip(need_docloc, fetched):
+            service_cache.store(grp_feat, docloc, fetch_seconds)
+            docloc_by_id[grp_feat.id] = docloc
+
+    for position, grp_feat, portal in to_build:
+        record = build_service_record(portal, grp_feat, service_owner_of(grp_feat),
+                                      fetch_docloc=lambda grp_feat: docloc_by_id[grp_feat.id])
+        if record_store is not None:
+            record_store.store(grp_feat, record)
+        records[position] = record
+
+    return records
+
+
+def harvest_rest(portal_url, username, password, group_titles=('Morgan and Mona',), group_query=None,
+                 whole_portal=False, max_concurrency=16, owner_directory=None, record_store=None,
+                 service_cache=None, search_filter=None):
+    import asyncio
+
+    return asyncio.run(harvest_rest_async(portal_url, username, password, group_titles, group_query,
+                                          whole_portal, max_concurrency, owner_directory, record_store,
+                                          service_cache, search_filter))
+
+
+class PortalArchive(object):
+    """
+        gzipped json archive of the portal responses a run used: group searches,
+        group content, item attributes, users and service properties. A recorded
+        run can be replayed offline from the archive, giving the same records
+    """
+
+    SECTIONS = ('groups', 'content', 'searches', 'items', 'users', 'user_pages', 'service_properties')
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.data = {section: {} for section in self.SECTIONS}
+        self.lock = threading.Lock()
+
+    def load(self):
+        with gzip.open(self.archive_path, 'rt', encoding='utf-8') as archive_file:
+            self.data.update(json.load(archive_file))
+        print('portal archive recorded {} loaded: {} items'.format(self.data.get('recorded'), len(self.data['items'])))
+
+    def save(self, portal):
+        """
+            written to a temporary file first so a failed write keeps the last archive
+        """
+        self.data['recorded'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.data['portal'] = portal
+        temp_path = self.archive_path + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as archive_file:
+            json.dump(self.data, archive_file, separators=(',', ':'))
+        os.replace(temp_path, self.archive_path)
+        print('portal archive saved: {} items'.format(len(self.data['items'])))
+
+    def record(self, section, key, value):
+        with self.lock:
+            self.data[section][key] = value
+
+    def replay(self, section, key):
+        try:
+            return self.data[section][key]
+        except KeyError:
+            raise KeyError('{} {} is not in the portal archive, record the run again'.format(section, key))
+
+    def recording_fetch(self, fetch):
+        """
+            a fetch_docloc that records what fetch returns
+        """
+        def fetch_and_record(grp_feat):
+            docloc = fetch(grp_feat)
+            self.record('service_properties', ServicePropertiesCache.key(grp_feat), docloc)
+            return docloc
+
+        return fetch_and_record
+
+    def replay_docloc(self, grp_feat):
+        return self.replay('service_properties', ServicePropertiesCache.key(grp_feat))
+
+
+class RecordingItem(object):
+    """
+        passes attribute reads through to an arcgis Item, recording all the
+        attributes the report uses the first time any of them is read
+    """
+
+    def __init__(self, item, archive):
+        self.__dict__['_item'] = item
+        self.__dict__['_archive'] = archive
+        self.__dict__['_recorded'] = False
+
+    def __getattr__(self, name):
+        item = self.__dict__['_item']
+        if not self.__dict__['_recorded']:
+            self.__dict__['_recorded'] = True
+            self.__dict__['_archive'].record('items', str(item.id),
+                                             {attr: getattr(item, attr) for attr in RestItem.__slots__})
+
+        return getattr(item, name)
+
+    def __repr__(self):
+        return repr(self.__dict__['_item'])
+
+
+class RecordingGroup(object):
+
+    def __init__(self, grp, archive):
+        self.grp = grp
+        self.archive = archive
+        self.id = grp.id
+        self.title = grp.title
+
+    def content(self):
+        grp_items = self.grp.content()
+        self.archive.record('content', self.id, [str(grp_feat.id) for grp_feat in grp_items])
+        return [RecordingItem(grp_feat, self.archive) for grp_feat in grp_items]
+
+    def __repr__(self):
+        return repr(self.grp)
+
+
+class RecordingUserManager(object):
+
+    def __init__(self, users, archive):
+        self.users = users
+        self.archive = archive
+
+    def get(self, username):
+        user = self.users.get(username=username)
+        self.archive.record('users', username, user.fullName)
+        return user
+
+    def advanced_search(self, query, start=1, max_users=100, as_dict=False):
+        page = self.users.advanced_search(query=query, start=start, max_users=max_users, as_dict=as_dict)
+        self.archive.record('user_pages', '{}|{}|{}'.format(query, start, max_users), page)
+        return page
+
+
+class RecordingGroupManager(object):
+
+    def __init__(self, groups, archive):
+        self.groups = groups
+        self.archive = archive
+
+    def search(self, query, max_groups=100):
+        found = self.groups.search(query, max_groups=max_groups)
+        self.archive.record('groups', '{}|{}'.format(query, max_groups), [{'id': grp.id, 'title': grp.title} for grp in found])
+        return [RecordingGroup(grp, self.archive) for grp in found]
+
+
+class RecordingContentManager(object):
+
+    def __init__(self, content, archive):
+        self.content = content
+        self.archive = archive
+
+    def advanced_search(self, query, max_items=100, start=1, as_dict=False):
+        page = self.content.advanced_search(query, max_items=max_items, start=start, as_dict=as_dict)
+        self.archive.record('searches', '{}|{}|{}'.format(query, start, max_items), page)
+        return page
+
+
+class RecordingGIS(object):
+    """
+        wraps a logged in GIS and records the responses into a PortalArchive
+    """
+
+    def __init__(self, gis, archive):
+        self.gis = gis
+        self.archive = archive
+        self.users = RecordingUserManager(gis.users, archive)
+        self.groups = RecordingGroupManager(gis.groups, archive)
+        self.content = RecordingContentManager(gis.content, archive)
+
+    def item_from_search(self, item_json):
+        return RecordingItem(search_item(self.gis, item_json), self.archive)
+
+    def __getattr__(self, name):
+        return getattr(self.gis, name)
+
+
+class ReplayItem(RestItem):
+    """
+        portal item from a dict of its attributes, recorded in the archive
+        or sent to a worker process by the pipeline
+    """
+
+    __slots__ = ()
+
+    def __init__(self, attributes):
+        for attr in RestItem.__slots__:
+            setattr(self, attr, attributes.get(attr))
+
+
+class ReplayGroup(object):
+
+    def __init__(self, archive, group_id, title):
+        self.archive = archive
+        self.id = group_id
+        self.title = title
+
+    def content(self):
+        return [ReplayItem(self.archive.replay('items', item_id)) for item_id in self.archive.replay('content', self.id)]
+
+    def __repr__(self):
+        return '<Group title:"{}">'.format(self.title)
+
+
+class ReplayUserManager(object):
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def get(self, username):
+        return types.SimpleNamespace(username=username, fullName=self.archive.replay('users', username))
+
+    def advanced_search(self, query, start=1, max_users=100, as_dict=False):
+        return self.archive.replay('user_pages', '{}|{}|{}'.format(query, start, max_users))
+
+
+class ReplayGroupManager(object):
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def search(self, query, max_groups=100):
+        found = self.archive.replay('groups', '{}|{}'.format(query, max_groups))
+        return [ReplayGroup(self.archive, grp['id'], grp['title']) for grp in found]
+
+
+class ReplayContentManager(object):
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def advanced_search(self, query, max_items=100, start=1, as_dict=False):
+        return self.archive.replay('searches', '{}|{}|{}'.format(query, start, max_items))
+
+
+class ReplayGIS(object):
+    """
+        answers the portal calls of a run from a PortalArchive, offline
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.users = ReplayUserManager(archive)
+        self.groups = ReplayGroupManager(archive)
+        self.content = ReplayContentManager(archive)
+
+    def item_from_search(self, item_json):
+        return ReplayItem(self.archive.replay('items', str(item_json['id'])))
+
+
+# where the portal is and where the reports go, any of them can be set with the
+# environment variables named in the command line help
+DEFAULT_PORTAL_URL = os.environ.get('MOMO_PORTAL_URL', r"https://onemap-northsea-uk.bpglobal.com/portal")
+DEFAULT_OUT_FOLDER_WEEKLY = os.environ.get('MOMO_WEEKLY_FOLDER', r'\\aadanfusw0-fb3b\Digital\dataWorx\Geospatial\Region\NorthSea\Geospatial\Scratch\GMcLachlan\Projects\MoMo\Docs\Data_Lists\Weekly_Lists')
+DEFAULT_OUT_FOLDER_MAIN = os.environ.get('MOMO_REPORT_FOLDER', r'\\aadanfusw0-fb3b\Digital\dataWorx\Geospatial\Region\NorthSea\Geospatial\Scratch\GMcLachlan\Projects\MoMo\Docs\Data_Lists\Meta_Data_Report')
+DEFAULT_OUT_COMP_FOLDER = os.environ.get('MOMO_COMPARISON_FOLDER', r'\\aadanfusw0-fb3b\Digital\dataWorx\Geospatial\Region\NorthSea\Geospatial\Scratch\GMcLachlan\Projects\MoMo\Docs\Data_Lists\Comparison_List')
+DEFAULT_OUT_FILE_NAME = 'MoMo_MetaDataReport.xlsx'
+
+# local files kept between runs
+LOCAL_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_extract_info(excel_report_output, harvest_workers=1, owner_cache_path=None, preload_owners=False,
+                     record_store_path=None, force_refresh=False, report_sinks=('xlsx',),
+                     group_titles=('Morgan and Mona',), group_query=None, whole_portal=False,
+                     backend='arcgis', service_cache_path=None, journal_path=None, checkpoint_every=100,
+                     portal_archive_path=None, portal_archive_mode=None,
+                     portal=DEFAULT_PORTAL_URL, username=None, password=None, parse_workers=0,
+                     raw_descriptions=False, search_filter=None):
+
+    # the portal calls are limited to the number of workers and backed off when the portal is busy
+    PORTAL_CALLS.configure(max_concurrency=harvest_workers or 1)
+    RUN_TIMINGS.reset()
+
+    # a recorded run goes to the portal for everything so the archive is complete,
+    # and a replayed run doesnt depend on anything but the archive. Only the arcgis
+    # backend records and replays the portal calls
+    portal_archive = None
+    if portal_archive_mode is not None:
+        if backend != 'arcgis':
+            raise ValueError('portal archive {} needs the arcgis backend'.format(portal_archive_mode))
+        portal_archive = PortalArchive(portal_archive_path)
+        if portal_archive_mode == 'replay':
+            portal_archive.load()
+        owner_cache_path = record_store_path = service_cache_path = journal_path = None
+
+    # records are collected column by column and turned into a dataframe at the end
+    accumulator = RecordAccumulator(raw_descriptions)
+
+    # the report files are written row by row as the records come in
+    report_writer = ReportWriter(excel_report_output, report_sinks)
+
+    # records from the last run, reused for items that have not changed
+    record_store = None
+    if record_store_path is not None:
+        record_store = RecordStore(record_store_path, force_refresh)
+
+    # service properties from the last run, fetched again for edited items.
+    # These dont depend on the parsing rules so they are kept on a force_refresh
+    service_cache = ServicePropertiesCache(service_cache_path)
+    service_cache.load_cache()
+    if portal_archive_mode == 'record':
+        service_cache.fetch = portal_archive.recording_fetch(service_cache.fetch)
+    elif portal_archive_mode == 'replay':
+        service_cache.fetch = portal_archive.replay_docloc
+
+    journal = None
+
+    if backend == 'rest':
+        # talk to the sharing rest api directly, owners come from the cache or the portal
+        owner_directory = OwnerDirectory(None, owner_cache_path)
+        owner_directory.load_cache()
+        harvested = harvest_rest(portal, username, password, group_titles, group_query, whole_portal,
+                                 harvest_workers, owner_directory, record_store, service_cache, search_filter)
+
+    else:
+        if portal_archive_mode == 'replay':
+            # answer the portal calls from the archive, offline
+            print('replaying {}'.format(portal_archive_path))
+            gis = ReplayGIS(portal_archive)
+        else:
+            # Log in to the portal
+            print('login in...')
+            load_arcgis()
+            with RUN_TIMINGS.phase('login'):
+                gis = PORTAL_CALLS.call('login', GIS, portal, username, password)
+            configure_connection_pool(gis, max(10, harvest_workers or 1))
+
+            if portal_archive_mode == 'record':
+                gis = RecordingGIS(gis, portal_archive)
+
+        # owner full names, looked up once per user
+        owner_directory = OwnerDirectory(gis, owner_cache_path)
+        if preload_owners:
+            owner_directory.preload()
+
+        # find the groups and list each unique item in them once
+        groups = find_groups(gis, group_titles, group_query, whole_portal)
+        print(groups)
+        crawled_items = crawl_groups(groups, harvest_workers, gis, search_filter)
+
+        # with parse_workers the descriptions are cleaned and parsed in worker processes
+        def harvest(items):
+            if parse_workers:
+                return pipeline_items(items, gis, harvest_workers, parse_workers, owner_directory,
+                                      record_store, service_cache)
+            return harvest_items(items, gis, harvest_workers, owner_directory, record_store, service_cache)
+
+        # completed records are journaled so a failed run can be restarted where it stopped
+        if journal_path is not None:
+            journal = RunJournal(journal_path, checkpoint_every)
+            harvested = harvest_with_journal(crawled_items, journal, harvest, record_store)
+        else:
+            harvested = harvest(crawled_items)
+
+    for feat_info in harvested:
+
+        # add the record to the report
+        if feat_info is None:
+            pass
+        else:
+            accumulator.append(feat_info)
+            with RUN_TIMINGS.phase('report write'):
+                report_writer.write_record(feat_info)
+
+    with RUN_TIMINGS.phase('report write'):
+        report_writer.close()
+
+    # build the report dataframe in one go
+    with RUN_TIMINGS.phase('dataframe build'):
+        df_proc_export = accumulator.to_dataframe()
+
+    owner_directory.save_cache()
+    owner_directory.report()
+
+    service_cache.save_cache()
+    service_cache.report()
+
+    PORTAL_CALLS.report()
+
+    if search_filter is not None:
+        search_filter.report()
+
+    if portal_archive_mode == 'record':
+        portal_archive.save(portal)
+
+    # the run finished, the next run starts afresh
+    if journal is not None:
+        journal.report()
+        journal.remove()
+
+    if record_store is not None:
+        record_store.save()
+        record_store.close()
+        record_store.report()
+
+    # cache and reuse figures for the run report
+    RUN_TIMINGS.count('records', len(df_proc_export))
+    RUN_TIMINGS.count('owner directory', {'hits': owner_directory.hits, 'misses': owner_directory.misses})
+    RUN_TIMINGS.count('service properties', {'hits': service_cache.hits, 'misses': service_cache.misses})
+    if record_store is not None:
+        RUN_TIMINGS.count('record store', {'reused': record_store.reused, 'resumed': record_store.resumed,
+                                            'extracted': record_store.extracted})
+    if journal is not None:
+        RUN_TIMINGS.count('journal resumed', journal.resumed)
+    if search_filter is not None:
+        RUN_TIMINGS.count('group search', {'listed': search_filter.listed, 'kept': search_filter.kept})
+
+    return df_proc_export
+
+def week_info_from_datetime(date_mod):
+    """
+        date, time and week number used to name the snapshots and comparisons
+    """
+    yyyy_date = date_mod.strftime('%Y%m%d')
+    week_no = date_mod.isocalendar()[1]
+    ms = date_mod.strftime('%H%M')
+
+    return '{}_{}_Week_{}'.format(yyyy_date, ms, week_no)
+
+
+def snapshot_path(snapshot_folder, week_info):
+    return os.path.join(snapshot_folder, '{}_MoMo_MetaDataReport.parquet'.format(week_info))
+
+
+def save_snapshot(df_report, snapshot_folder, week_info):
+    """
+        store a run as a compressed parquet snapshot, written to a temporary
+        file first so a failed write never leaves a half snapshot behind
+    """
+    out_snapshot = snapshot_path(snapshot_folder, week_info)
+    temp_snapshot = out_snapshot + '.tmp'
+    df_report.to_parquet(temp_snapshot, compression='gzip', index=False)
+    os.replace(temp_snapshot, out_snapshot)
+
+    return out_snapshot
+
+
+def find_latest_snapshot(snapshot_folder):
+    """
+        the newest snapshot in the folder and its week info, the names start
+        with the date and time so they sort in run order
+    """
+    suffix = '_MoMo_MetaDataReport.parquet'
+    snapshots = sorted(file_name for file_name in os.listdir(snapshot_folder) if file_name.endswith(suffix))
+    if not snapshots:
+        return None, ''
+
+    return os.path.join(snapshot_folder, snapshots[-1]), snapshots[-1][:-len(suffix)]
+
+
+def snapshot_from_excel(excel_report_output, snapshot_folder):
+    """
+        turn an excel report from before the snapshots into a snapshot so it
+        can be compared with, named after the date the report was last modified
+    """
+    import pandas as pd
+
+    if not os.path.isfile(excel_report_output):
+        return None, ''
+
+    print('creating snapshot from {}'.format(excel_report_output))
+    date_mod = datetime.datetime.fromtimestamp(os.path.getmtime(excel_report_output))
+    prev_week_info = week_info_from_datetime(date_mod)
+
+    # read everything as text so the columns have one type each, only empty cells are
+    # null so text like None reads back as written
+    df_sheets = pd.read_excel(excel_report_output, sheet_name=None, dtype=str, keep_default_na=False, na_values=[''])
+    df_report = pd.concat(list(df_sheets.values()), ignore_index=True)
+
+    return save_snapshot(df_report, snapshot_folder, prev_week_info), prev_week_info
+
+
+# the change log is kept with the snapshots
+CHANGE_LOG_NAME = 'MoMo_ChangeLog.sqlite'
+
+
+class ChangeLog(object):
+    """
+        append only history of the runs in a local sqlite file. Each run stores
+        only the fields that changed for each service id since the run before,
+        a null field marks a service that was removed. Any run can be rebuilt
+        from the log and two runs are diffed from the changes between them
+    """
+
+    def __init__(self, log_path):
+        self.connection = sqlite3.connect(log_path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS runs '
+                                    '(run_id INTEGER PRIMARY KEY, week_info TEXT UNIQUE, logged REAL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS changes '
+                                    '(run_id INTEGER, service_id TEXT, field TEXT, value TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS changes_run ON changes (run_id, service_id)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS changes_service ON changes (service_id, run_id)')
+            # the fields of each service as of the last run, to find what the next run changed
+            self.connection.execute('CREATE TABLE IF NOT EXISTS latest (service_id TEXT PRIMARY KEY, fields TEXT)')
+
+    def runs(self):
+        return [week_info for week_info, in self.connection.execute('SELECT week_info FROM runs ORDER BY run_id')]
+
+    def find_run(self, week_info):
+        """
+            the run id and week info of a run, given its week info or whole parts
+            of it, the end like Week_12 or the start like 20240105. Parts that
+            match more than one run are an error
+        """
+        runs = self.connection.execute('SELECT run_id, week_info FROM runs ORDER BY run_id').fetchall()
+        found = [run for run in runs if run[1] == week_info]
+        if not found:
+            found = [run for run in runs
+                     if run[1].endswith('_' + week_info) or run[1].startswith(week_info + '_')]
+        if not found:
+            raise ValueError('no run {} in the change log'.format(week_info))
+        if len(found) > 1:
+            raise ValueError('{} matches more than one run in the change log: {}'.format(
+                week_info, ', '.join(run[1] for run in found)))
+
+        return found[0]
+
+    def append(self, week_info, df_report):
+        """
+            log a run from its report dataframe, returns the number of changes logged.
+            Runs are logged in week info order, older runs are skipped
+        """
+        runs = self.runs()
+        if runs and week_info <= runs[-1]:
+            print('change log: {} is not after {}, skipped'.format(week_info, runs[-1]))
+            return 0
+
+        columns = [column for column in REPORT_COLUMNS if column in df_report.columns and column != 'Service ID']
+        latest = {service_id: json.loads(fields)
+                  for service_id, fields in self.connection.execute('SELECT service_id, fields FROM latest')}
+
+        changes = []
+        updated = {}
+        seen = set()
+        for record in records_from_frame(df_report):
+            service_id = record.service_id
+            seen.add(service_id)
+            previous = latest.get(service_id, {})
+            fields = {column: getattr(record, REPORT_ATTRS[column]) for column in columns}
+            changed = [column for column in columns if column not in previous or previous[column] != fields[column]]
+            if changed:
+                changes.extend((service_id, column, json.dumps(fields[column])) for column in changed)
+                updated[service_id] = json.dumps(dict(previous, **fields))
+        removed = [service_id for service_id in latest if service_id not in seen]
+        changes.extend((service_id, None, None) for service_id in removed)
+
+        with self.connection:
+            run_id = self.connection.execute('INSERT INTO runs (week_info, logged) VALUES (?, ?)',
+                                             (week_info, time.time())).lastrowid
+            self.connection.executemany('INSERT INTO changes VALUES (?, ?, ?, ?)',
+                                        [(run_id,) + change for change in changes])
+            self.connection.executemany('INSERT OR REPLACE INTO latest VALUES (?, ?)', updated.items())
+            self.connection.executemany('DELETE FROM latest WHERE service_id = ?', [(service_id,) for service_id in removed])
+
+        print('change log: {} changes to {} services, {} removed, logged for {}'.format(
+            len(changes) - len(removed), len(updated), len(removed), week_info))
+
+        return len(changes)
+
+    def replay(self, rows):
+        """
+            the services rebuilt from their changes in run order, removed services drop out
+        """
+        services = {}
+        for service_id, field, value in rows:
+            if field is None:
+                services.pop(service_id, None)
+            else:
+                services.setdefault(service_id, {})[field] = json.loads(value)
+
+        return services
+
+    def service_states(self, service_ids, run_ids):
+        """
+            the fields of the services as of each of the runs, read from the history of just those services
+        """
+        history = {}
+        service_ids = list(service_ids)
+        for start in range(0, len(service_ids), 500):
+            batch = service_ids[start:start + 500]
+            query = ('SELECT run_id, service_id, field, value FROM changes WHERE service_id IN ({}) AND run_id <= ? '
+                     'ORDER BY run_id, rowid'.format(','.join('?' * len(batch))))
+            for row in self.connection.execute(query, batch + [max(run_ids)]):
+                history.setdefault(row[1], []).append(row)
+
+        states = {run_id: {} for run_id in run_ids}
+        for service_id, rows in history.items():
+            for run_id in run_ids:
+                states[run_id].update(self.replay(row[1:] for row in rows if row[0] <= run_id))
+
+        return states
+
+    def state_frame(self, services):
+        import pandas as pd
+
+        columns = [column for column in REPORT_COLUMNS
+                   if column == 'Service ID' or any(column in fields for fields in services.values())]
+        rows = [dict(fields, **{'Service ID': service_id}) for service_id, fields in sorted(services.items())]
+
+        return pd.DataFrame(rows, columns=columns)
+
+    def state(self, week_info):
+        """
+            the report dataframe of a run rebuilt from the log
+        """
+        rows = self.connection.execute('SELECT service_id, field, value FROM changes WHERE run_id <= ? '
+                                       'ORDER BY run_id, rowid', (self.find_run(week_info)[0],))
+
+        return self.state_frame(self.replay(rows))
+
+    def diff(self, current_week_info, previous_week_info):
+        """
+            the services updated, new and removed between two runs, read from the
+            changes logged between them. Updated services have a row for each
+            field that differs with its previous and current value
+        """
+        import pandas as pd
+
+        current_run, previous_run = self.find_run(current_week_info)[0], self.find_run(previous_week_info)[0]
+        first_run, last_run = sorted((current_run, previous_run))
+        service_ids = [service_id for service_id, in self.connection.execute(
+            'SELECT DISTINCT service_id FROM changes WHERE run_id > ? AND run_id <= ?', (first_run, last_run))]
+
+        states = self.service_states(service_ids, (current_run, previous_run))
+        current, previous = states[current_run], states[previous_run]
+
+        updated = []
+        for service_id in sorted(set(current) & set(previous)):
+            fields = current[service_id]
+            for column in REPORT_COLUMNS:
+                if column in fields and column in previous[service_id] and fields[column] != previous[service_id][column]:
+                    updated.append((service_id, fields.get('Title'), fields.get('Type'), column,
+                                    previous[service_id][column], fields[column]))
+
+        df_updated = pd.DataFrame(updated, columns=['Service ID', 'Title', 'Type', 'Field', 'Previous', 'Current'])
+        df_new = self.state_frame({service_id: current[service_id] for service_id in set(current) - set(previous)})
+        df_removed = self.state_frame({service_id: previous[service_id] for service_id in set(previous) - set(current)})
+
+        return df_updated, df_new, df_removed
+
+    def close(self):
+        self.connection.close()
+
+
+# sheets compared between runs
+COMPARE_SHEETS = ['Services', 'Downloadable', 'Maps', 'Apps and Tools']
+
+
+def load_comparison_frames(report_source, sheet_names=COMPARE_SHEETS):
+    """
+        read a snapshot or an excel report once, keeping only the columns the
+        comparison uses, and return a dataframe for each of the sheets with the
+        values as report text
+    """
+    import pandas as pd
+
+    columns = COMPARE_KEY_COLUMNS + COMPARE_VALUE_COLUMNS + COMPARE_EXTRA_COLUMNS
+
+    if report_source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        # snapshots from before the content hash have no hash column
+        available = set(pq.read_schema(report_source).names)
+        df_report = pd.read_parquet(report_source, columns=[column for column in columns + [CONTENT_HASH_COLUMN]
+                                                            if column in available])
+        return split_report_sheets(report_text_frame(df_report), sheet_names)
+
+    # older reports are excel workbooks with a sheet for each report sheet
+    xl = pd.ExcelFile(report_source)
+    df_sheets = {}
+    for sheet_name in sheet_names:
+        if sheet_name in xl.sheet_names:
+            df_sheets[sheet_name] = xl.parse(sheet_name, usecols=lambda column: column in columns, dtype=str,
+                                             keep_default_na=False, na_values=[''])
+        else:
+            df_sheets[sheet_name] = pd.DataFrame(columns=columns)
+    xl.close()
+
+    return df_sheets
+
+
+def run_comparison_info(current_source, previous_source, cur_week_info, prev_week_info, out_comp_folder,
+                        sheet_names=COMPARE_SHEETS):
+    import pandas as pd
+
+    # Run the comparison
+    # report output
+    excel_export_comparison = os.path.join(out_comp_folder, '{}_Compairson_{}.xlsx'.format(cur_week_info, prev_week_info))
+
+    # load each report once, the frames are shared by all the sheet comparisons
+    df_sheets_current = load_comparison_frames(current_source, sheet_names)
+    df_sheets_previous = load_comparison_frames(previous_source, sheet_names)
+
+    # compare the reports on a certain sheet
+    writer = pd.ExcelWriter(excel_export_comparison)
+    for sheet_name in sheet_names:
+        compare_reports(df_sheets_current[sheet_name], df_sheets_previous[sheet_name], sheet_name, writer)
+    # close writes the file, save was removed in pandas 2
+    writer.close()
     
-    main()
+    return excel_export_comparison
+
+def week_info_from_source(report_source):
+    """
+        the week info of a snapshot from its name, or of an excel report from
+        the date it was last modified
+    """
+    suffix = '_MoMo_MetaDataReport.parquet'
+    file_name = os.path.basename(report_source)
+    if file_name.endswith(suffix):
+        return file_name[:-len(suffix)]
+
+    return week_info_from_datetime(datetime.datetime.fromtimestamp(os.path.getmtime(report_source)))
+
+
+def portal_credentials(args):
+    """
+        the portal login from the arguments, the environment or a prompt
+    """
+    username = args.username or os.environ.get('MOMO_PORTAL_USERNAME')
+    password = args.password or os.environ.get('MOMO_PORTAL_PASSWORD')
+    if username is None:
+        username = input('portal username: ')
+    if password is None:
+        password = getpass.getpass('portal password for {}: '.format(username))
+
+    return username, password
+
+
+def run_extract_command(args):
+    """
+        harvest the portal into the report, keep the run as a snapshot and
+        compare it with the last one
+    """
+    # groups to report on when none are given
+    group_titles = args.group
+    if group_titles is None and args.group_query is None and not args.whole_portal:
+        group_titles = ['Morgan and Mona']
+
+    # the group search leaves the items the report does not use on the portal
+    search_filter = None
+    modified_since = None
+    if args.modified_since is not None:
+        modified_since = int(datetime.datetime.strptime(args.modified_since, '%Y-%m-%d').timestamp() * 1000)
+    if modified_since is not None and args.listing != 'search':
+        raise SystemExit('--modified-since needs the search listing')
+    if args.archive_mode is not None and args.backend != 'arcgis':
+        raise SystemExit('--archive-mode needs the arcgis backend')
+
+    username = password = None
+    if args.archive_mode != 'replay':
+        username, password = portal_credentials(args)
+    if args.listing == 'search':
+        search_filter = ItemSearchFilter(None if args.all_types else list(REPORT_SHEET_BY_TYPE),
+                                         modified_since=modified_since)
+
+    # the full metadata report location, a replayed run or a run of just the
+    # recent changes writes its own report and leaves the weekly report alone
+    weekly_report = excel_report_output = os.path.join(args.report_folder, args.report_name)
+    report_base, report_ext = os.path.splitext(args.report_name)
+    if args.output is not None:
+        excel_report_output = args.output
+    elif args.archive_mode == 'replay':
+        excel_report_output = os.path.join(os.path.dirname(os.path.abspath(args.archive_path)),
+                                           '{}_Replay{}'.format(report_base, report_ext))
+    elif modified_since is not None:
+        excel_report_output = os.path.join(args.local_folder, '{}_Since_{}{}'.format(
+            report_base, args.modified_since.replace('-', ''), report_ext))
+
+    # the record store, service cache and journal hold the whole portal, a run
+    # of the recent changes would cut them down to the few items it saw
+    keep_state = modified_since is None
+    record_store_path = service_cache_path = journal_path = None
+    if keep_state:
+        record_store_path = os.path.join(args.local_folder, 'MoMo_RecordStore.sqlite')
+        service_cache_path = os.path.join(args.local_folder, 'MoMo_ServiceProperties.json')
+        journal_path = os.path.join(args.local_folder, 'MoMo_RunJournal.jsonl')
+
+    # each run is kept as a snapshot, the latest one is compared with the new run
+    snapshot_folder = args.weekly_folder
+    previous_snapshot = prev_week_info = None
+    if keep_state and args.archive_mode != 'replay':
+        previous_snapshot, prev_week_info = find_latest_snapshot(snapshot_folder)
+        if previous_snapshot is None:
+            previous_snapshot, prev_week_info = snapshot_from_excel(weekly_report, snapshot_folder)
+
+    # extract the new
+    df_report = run_extract_info(excel_report_output,
+                     harvest_workers=args.workers,
+                     owner_cache_path=os.path.join(args.local_folder, 'MoMo_OwnerDirectory.json'),
+                     preload_owners=not args.no_preload_owners,
+                     record_store_path=record_store_path,
+                     force_refresh=args.force_refresh,
+                     report_sinks=args.sinks,
+                     group_titles=group_titles,
+                     group_query=args.group_query,
+                     whole_portal=args.whole_portal,
+                     backend=args.backend,
+                     service_cache_path=service_cache_path,
+                     journal_path=journal_path,
+                     checkpoint_every=args.checkpoint_every,
+                     portal_archive_path=args.archive_path,
+                     portal_archive_mode=args.archive_mode,
+                     portal=args.portal,
+                     username=username,
+                     password=password,
+                     parse_workers=args.parse_workers,
+                     raw_descriptions=args.raw_descriptions,
+                     search_filter=search_filter)
+
+    # a replayed run is not a new week of the portal, nor is a run of just the recent changes
+    if args.archive_mode == 'replay' or not keep_state:
+        print('report written to {}'.format(excel_report_output))
+        return
+
+    cur_week_info = week_info_from_datetime(datetime.datetime.now())
+    with RUN_TIMINGS.phase('snapshot'):
+        current_snapshot = save_snapshot(df_report, snapshot_folder, cur_week_info)
+
+    # run comparison
+    if previous_snapshot is not None and not args.no_compare:
+        with RUN_TIMINGS.phase('compare'):
+            excel_export_comparison = run_comparison_info(current_snapshot, previous_snapshot, cur_week_info, prev_week_info, args.comparison_folder)
+
+    # the changes since the last run go in the history kept with the snapshots
+    with RUN_TIMINGS.phase('change log'):
+        change_log = ChangeLog(os.path.join(snapshot_folder, CHANGE_LOG_NAME))
+        change_log.append(cur_week_info, df_report)
+        change_log.close()
+
+    # phase and item timings kept with the snapshots to follow from week to week
+    run_report = RUN_TIMINGS.save(os.path.join(snapshot_folder, '{}_MoMo_RunReport.json'.format(cur_week_info)))
+    print('run report: {}'.format(run_report))
+
+
+def run_compare_command(args):
+    """
+        compare two snapshots or excel reports, by default the latest two snapshots
+    """
+    current_source, previous_source = args.current, args.previous
+    if current_source is None:
+        snapshots = sorted(file_name for file_name in os.listdir(args.weekly_folder)
+                           if file_name.endswith('_MoMo_MetaDataReport.parquet'))
+        if len(snapshots) < 2:
+            raise SystemExit('need two snapshots in {} to compare'.format(args.weekly_folder))
+        current_source = os.path.join(args.weekly_folder, snapshots[-1])
+        previous_source = os.path.join(args.weekly_folder, snapshots[-2])
+    elif previous_source is None:
+        raise SystemExit('give the previous report to compare with')
+
+    excel_export_comparison = run_comparison_info(current_source, previous_source,
+                                                  week_info_from_source(current_source),
+                                                  week_info_from_source(previous_source),
+                                                  args.comparison_folder)
+    print('comparison: {}'.format(excel_export_comparison))
+
+
+def run_history_command(args):
+    """
+        list the runs in the change log, or diff two of them. With --backfill the
+        snapshots newer than the last logged run are added to the log first
+    """
+    import pandas as pd
+
+    change_log = ChangeLog(os.path.join(args.weekly_folder, CHANGE_LOG_NAME))
+    try:
+        if args.backfill:
+            suffix = '_MoMo_MetaDataReport.parquet'
+            for file_name in sorted(os.listdir(args.weekly_folder)):
+                if file_name.endswith(suffix) and file_name[:-len(suffix)] not in change_log.runs():
+                    change_log.append(file_name[:-len(suffix)], pd.read_parquet(os.path.join(args.weekly_folder, file_name)))
+
+        if args.current is None:
+            for week_info in change_log.runs():
+                print(week_info)
+            return
+
+        if args.previous is None:
+            raise SystemExit('give the previous run to diff with')
+
+        try:
+            df_updated, df_new, df_removed = change_log.diff(args.current, args.previous)
+            cur_week_info = change_log.find_run(args.current)[1]
+            prev_week_info = change_log.find_run(args.previous)[1]
+        except ValueError as error:
+            raise SystemExit(str(error))
+    finally:
+        change_log.close()
+
+    excel_export_changes = os.path.join(args.comparison_folder, '{}_Changes_{}.xlsx'.format(cur_week_info, prev_week_info))
+    writer = pd.ExcelWriter(excel_export_changes)
+    df_updated.to_excel(writer, sheet_name='Updated', index=False, header=True)
+    df_new.to_excel(writer, sheet_name='New', index=False, header=True)
+    df_removed.to_excel(writer, sheet_name='Removed', index=False, header=True)
+    writer.close()
+    print('{} field changes, {} new and {} removed services: {}'.format(
+        len(df_updated), len(df_new), len(df_removed), excel_export_changes))
+
+
+def run_report_command(args):
+    """
+        write the report files from a snapshot, or a run rebuilt from the
+        change log, without going to the portal
+    """
+    import pandas as pd
+
+    if args.week is not None:
+        change_log = ChangeLog(os.path.join(args.weekly_folder, CHANGE_LOG_NAME))
+        try:
+            snapshot = 'the change log'
+            df_report = change_log.state(args.week)
+        except ValueError as error:
+            raise SystemExit(str(error))
+        finally:
+            change_log.close()
+    else:
+        snapshot = args.snapshot
+        if snapshot is None:
+            snapshot, week_info = find_latest_snapshot(args.weekly_folder)
+            if snapshot is None:
+                raise SystemExit('no snapshots in {}'.format(args.weekly_folder))
+
+        df_report = pd.read_parquet(snapshot)
+
+    report_output = args.output or os.path.join(args.report_folder, args.report_name)
+    report_writer = ReportWriter(report_output, args.sinks)
+    for record in records_from_frame(df_report):
+        report_writer.write_record(record)
+    report_writer.close()
+    print('{} records from {} written to {}'.format(len(df_report), snapshot, report_output))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='MoMo portal metadata report. Paths default to the share and can also be set with '
+                    'MOMO_PORTAL_URL, MOMO_REPORT_FOLDER, MOMO_WEEKLY_FOLDER and MOMO_COMPARISON_FOLDER, '
+                    'the login with MOMO_PORTAL_USERNAME and MOMO_PORTAL_PASSWORD')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_folders(subparser):
+        subparser.add_argument('--report-folder', default=DEFAULT_OUT_FOLDER_MAIN, help='folder of the metadata report')
+        subparser.add_argument('--report-name', default=DEFAULT_OUT_FILE_NAME, help='file name of the metadata report')
+        subparser.add_argument('--weekly-folder', default=DEFAULT_OUT_FOLDER_WEEKLY, help='folder of the weekly snapshots')
+        subparser.add_argument('--comparison-folder', default=DEFAULT_OUT_COMP_FOLDER, help='folder of the comparisons')
+
+    extract_parser = subparsers.add_parser('extract', help='harvest the portal into the report, snapshot it and compare with the last run')
+    add_folders(extract_parser)
+    extract_parser.add_argument('--portal', default=DEFAULT_PORTAL_URL, help='portal url')
+    extract_parser.add_argument('--username', help='portal username, or MOMO_PORTAL_USERNAME')
+    extract_parser.add_argument('--password', help='portal password, better set with MOMO_PORTAL_PASSWORD or left to the prompt')
+    extract_parser.add_argument('--local-folder', default=LOCAL_FOLDER, help='folder of the caches kept between runs')
+    extract_parser.add_argument('--workers', type=int, default=8, help='items fetched from the portal at once, 1 runs serially')
+    extract_parser.add_argument('--parse-workers', type=int, default=0,
+                                help='processes cleaning and parsing the descriptions alongside the portal '
+                                     'lookups, for large groups with long descriptions. 0 parses on the lookup threads')
+    extract_parser.add_argument('--raw-descriptions', action='store_true',
+                                help='keep the raw descriptions in the snapshot, the report files always have them')
+    extract_parser.add_argument('--group', action='append', help='group title to report on, can be repeated')
+    extract_parser.add_argument('--group-query', help='portal group search query to report on')
+    extract_parser.add_argument('--whole-portal', action='store_true', help='report on every group in the portal')
+    extract_parser.add_argument('--listing', choices=['search', 'content'], default='search',
+                                help='search lists only the items the report uses, content lists every item in the groups')
+    extract_parser.add_argument('--all-types', action='store_true',
+                                help='also list the item types with no report sheet, kept in the snapshot')
+    extract_parser.add_argument('--modified-since', help='only items modified since this date (YYYY-MM-DD), '
+                                                         'the run is not kept as a snapshot and its report goes '
+                                                         'in the local folder')
+    extract_parser.add_argument('--output', help='report path, by default the metadata report')
+    extract_parser.add_argument('--backend', choices=['arcgis', 'rest'], default='arcgis',
+                                help='arcgis uses the arcgis api, rest talks to the portal rest api with asyncio (needs aiohttp)')
+    extract_parser.add_argument('--sinks', nargs='+', choices=sorted(REPORT_SINKS), default=['xlsx'],
+                                help='report files written as the records come in, add csv or jsonl for those too. '
+                                     'The xlsx report is only readable once the run ends, a run that fails '
+                                     'leaves its rows in the .tmp.jsonl file beside it')
+    extract_parser.add_argument('--force-refresh', action='store_true',
+                                help='extract every item again, after changing the parsing rules')
+    extract_parser.add_argument('--no-preload-owners', action='store_true', help='look up owners one at a time')
+    extract_parser.add_argument('--checkpoint-every', type=int, default=100, help='items between journal checkpoints')
+    extract_parser.add_argument('--archive-mode', choices=['record', 'replay'],
+                                help='record the portal responses, or replay a recorded run offline '
+                                     'into a report next to the archive')
+    extract_parser.add_argument('--archive-path', default=os.path.join(LOCAL_FOLDER, 'MoMo_PortalArchive.json.gz'),
+                                help='portal archive for record and replay')
+    extract_parser.add_argument('--no-compare', action='store_true', help='skip the comparison with the last run')
+    extract_parser.set_defaults(func=run_extract_command)
+
+    compare_parser = subparsers.add_parser('compare', help='compare two reports, by default the latest two snapshots')
+    add_folders(compare_parser)
+    compare_parser.add_argument('current', nargs='?', help='current snapshot or excel report')
+    compare_parser.add_argument('previous', nargs='?', help='previous snapshot or excel report')
+    compare_parser.set_defaults(func=run_compare_command)
+
+    report_parser = subparsers.add_parser('report', help='write the report files from a snapshot')
+    add_folders(report_parser)
+    report_parser.add_argument('snapshot', nargs='?', help='snapshot to write, by default the latest')
+    report_parser.add_argument('--week', help='rebuild this run from the change log instead, a week info or part of one like Week_12')
+    report_parser.add_argument('--output', help='report path, by default the metadata report')
+    report_parser.add_argument('--sinks', nargs='+', choices=sorted(REPORT_SINKS), default=['xlsx'],
+                               help='report files to write')
+    report_parser.set_defaults(func=run_report_command)
+
+    history_parser = subparsers.add_parser('history', help='list the runs in the change log or diff any two of them')
+    add_folders(history_parser)
+    history_parser.add_argument('current', nargs='?', help='run to diff, a week info or part of one like Week_30')
+    history_parser.add_argument('previous', nargs='?', help='run to diff it with')
+    history_parser.add_argument('--backfill', action='store_true',
+                                help='log the snapshots newer than the last run in the change log first')
+    history_parser.set_defaults(func=run_history_command)
+
+    return parser
+
+
+# Main Function
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    print('starting {}'.format(args.command))
+    print("time started:", datetime.datetime.now())
+
+    args.func(args)
 
     print('completed')
-    now = datetime.datetime.now()
-    print("time finished:", now)
+    print("time finished:", datetime.datetime.now())
+
+
+if __name__ == "__main__":
+
+    main()